@@ -0,0 +1,128 @@
+#    Local cache of the Allen ontology and annotation volumes, so the export can run offline
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import copy
+import json
+import nrrd
+
+from annotation_volume import load_annotation, converted_path
+from resample import load_resampled
+
+CCF_VERSION_DEFAULT = "annotation/ccf_2017" # MouseConnectivityApi.CCF_VERSION_DEFAULT
+
+
+class AllenSdkApi(object):
+    """The Allen brain institute API, through the AllenSDK (needs the network)
+
+    The AllenSDK is only imported when the API is called, the cache and the
+    local stand-in work without it.
+    """
+
+    def structure_graph(self, graph_id):
+        """Cleaned structure graph, as used to build a StructureTree"""
+        from allensdk.api.queries.ontologies_api import OntologiesApi
+        from allensdk.core.structure_tree import StructureTree
+        structure_graph = OntologiesApi().get_structures_with_sets([graph_id])
+        # This removes some unused fields returned by the query
+        return StructureTree.clean_structures(structure_graph)
+
+    def download_annotation_volume(self, ccf_version, resolution, path):
+        from allensdk.api.queries.mouse_connectivity_api import MouseConnectivityApi
+        MouseConnectivityApi().download_annotation_volume(ccf_version, resolution, path)
+
+
+class LocalAllenApi(object):
+    """Stand-in for AllenSdkApi serving local data, to run the pipeline (or tests) with no network
+
+    structure_graphs maps graph ids to cleaned structure graphs, annotations maps
+    resolutions to annotation volumes in the nrrd axis order.
+    """
+
+    def __init__(self, structure_graphs, annotations):
+        self.structure_graphs = structure_graphs
+        self.annotations = annotations
+
+    def structure_graph(self, graph_id):
+        if graph_id not in self.structure_graphs:
+            raise LookupError("No local structure graph {}".format(graph_id))
+        return copy.deepcopy(self.structure_graphs[graph_id])
+
+    def download_annotation_volume(self, ccf_version, resolution, path):
+        if resolution not in self.annotations:
+            raise LookupError("No local annotation volume at {} um".format(resolution))
+        nrrd.write(path, self.annotations[resolution])
+
+
+class AllenCache(object):
+    """Structure graphs and annotation volumes kept on disk, the API is only used on a miss
+
+    Files are keyed by graph id, and by CCF version and resolution:
+        <cache_dir>/structure_graph_<graph_id>.json
+        <cache_dir>/<ccf version>/annotation_<resolution>.nrrd
+        <cache_dir>/<ccf version>/annotation_<resolution>_from_<source resolution>.npy (resampled)
+    With offline=True a miss raises an IOError instead of calling the API.
+    """
+
+    def __init__(self, cache_dir, api=None, offline=False, ccf_version=CCF_VERSION_DEFAULT):
+        self.cache_dir = cache_dir
+        self.api = api or AllenSdkApi()
+        self.offline = offline
+        self.ccf_version = ccf_version
+
+    def _fetch(self, path, description):
+        if self.offline:
+            raise IOError("{} is not in the cache {} and the cache is offline".format(description, self.cache_dir))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print("Fetching", description)
+
+    def structure_graph(self, graph_id):
+        """Cleaned structure graph (list of structure dicts)"""
+        path = os.path.join(self.cache_dir, "structure_graph_{}.json".format(graph_id))
+        if not os.path.isfile(path):
+            self._fetch(path, "structure graph {}".format(graph_id))
+            structure_graph = self.api.structure_graph(graph_id)
+            temporary_path = path + ".tmp"
+            with open(temporary_path, 'w') as file:
+                json.dump(structure_graph, file)
+            os.replace(temporary_path, path)
+        with open(path) as file:
+            return json.load(file)
+
+    def _version_dir(self):
+        return os.path.join(self.cache_dir, self.ccf_version.replace("/", "_"))
+
+    def annotation_path(self, resolution):
+        """Path of the annotation nrrd at the resolution (microns), downloaded on a miss"""
+        path = os.path.join(self._version_dir(), "annotation_{}.nrrd".format(resolution))
+        if not os.path.isfile(path):
+            self._fetch(path, "annotation volume {} at {} um".format(self.ccf_version, resolution))
+            temporary_path = path + ".tmp.nrrd"
+            self.api.download_annotation_volume(self.ccf_version, resolution, temporary_path)
+            os.replace(temporary_path, path)
+        return path
+
+    def annotation(self, resolution, source_resolution=None):
+        """Reoriented annotation volume at the resolution, memory-mapped (see annotation_volume)
+
+        With source_resolution, the volume is resampled from the one at that
+        resolution instead of downloaded, and cached (see resample).
+        """
+        if source_resolution is None or source_resolution == resolution:
+            return load_annotation(self.annotation_path(resolution))
+        source_path = self.annotation_path(source_resolution)
+        source = load_annotation(source_path)
+        path = os.path.join(self._version_dir(), "annotation_{}_from_{}.npy".format(resolution, source_resolution))
+        return load_resampled(source, converted_path(source_path), path, [source_resolution] * 3, [resolution] * 3)
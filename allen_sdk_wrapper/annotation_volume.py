@@ -0,0 +1,51 @@
+#    Memory-mapped loading of the Allen annotation volume
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import nrrd
+import numpy as np
+
+
+def reorient(annotation):
+    """Annotation from the nrrd axis order (AP, DV, ML) to the export one (AP, ML, DV), 0 being ventral"""
+    swapped_ann = np.swapaxes(annotation,1,2)
+    return swapped_ann[:,:,::-1] #Revert the z axis so the 0 is the ventral part
+
+def converted_path(nrrd_path):
+    """Path of the raw .npy copy of the nrrd annotation"""
+    return os.path.splitext(nrrd_path)[0] + ".npy"
+
+def convert_annotation(nrrd_path, npy_path=None):
+    """Write the reoriented annotation as a contiguous .npy file, return its path"""
+    npy_path = npy_path or converted_path(nrrd_path)
+    annotation, meta = nrrd.read(nrrd_path)
+    annotation = np.ascontiguousarray(reorient(annotation))
+    # Through a temporary file, an interrupted conversion must not look complete
+    temporary_path = npy_path + ".tmp.npy"
+    np.save(temporary_path, annotation)
+    os.replace(temporary_path, npy_path)
+    return npy_path
+
+def load_annotation(nrrd_path):
+    """Reoriented annotation volume, memory-mapped read-only
+
+    The nrrd is converted once to a .npy file next to it (again if the nrrd is newer).
+    Later runs open it with mmap: startup is immediate and the processes reading
+    the volume share the same pages.
+    """
+    npy_path = converted_path(nrrd_path)
+    if not os.path.isfile(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(nrrd_path):
+        convert_annotation(nrrd_path, npy_path)
+    return np.load(npy_path, mmap_mode='r')
@@ -0,0 +1,123 @@
+#    All the exported meshes in a single file, with an index for random access
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# A .bba file is a 28 bytes little-endian header:
+#     magic (8 bytes, b"BBATLAS\0"), version (uint32), index size, data offset (uint64 each)
+# followed by the index, UTF-8 JSON:
+#     {"resolution": [x, y, z], "structures": [{"id", "acronym", "name", "parent_id",
+#      "bounds": [lower, upper], "meshes": [{"voxel_size", "offset", "size", "vertex_count", "face_count"}]}]}
+# and, from the data offset, the meshes as .bbm blobs (see binary_mesh), the mesh
+# offsets being relative to the data offset. Levels of detail are meshes with a
+# larger voxel size. The reader in BrainBlender_Tree_Import follows the same layout.
+
+import os
+import json
+import shutil
+import struct
+
+from binary_mesh import read_header, read_mesh, read_normals, BINARY_EXTENSION
+from lod import lod_voxel_size
+
+MAGIC = b"BBATLAS\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQ")
+ALIGNMENT = 8 # Blobs start on multiples of 8 bytes
+
+
+def _aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+def write_atlas(path, report, structure_index, resolution):
+    """Pack the .bbm files of the report entries (and their LODs) into one archive
+
+    structure_index is the index of structure_index.build_structure_index.
+    Structures without a binary mesh are left out.
+    """
+    structures = []
+    blobs = []
+    data_size = 0
+    for entry in report:
+        files = sorted((lod_voxel_size(file, resolution), file) for file in entry["files"]
+                       if file.endswith(BINARY_EXTENSION))
+        if not files:
+            continue
+        info = structure_index[entry["id"]]
+        structure = {"id": entry["id"], "acronym": info["acronym"], "name": entry["name"],
+                     "parent_id": info["parent_id"], "bounds": None, "meshes": []}
+        for voxel_size, file in files:
+            n_verts, n_faces, flags = read_header(file)
+            if voxel_size == resolution[0] and n_verts:
+                verts = read_mesh(file)[0]
+                structure["bounds"] = [verts.min(axis=0).tolist(), verts.max(axis=0).tolist()]
+                del verts
+            size = os.path.getsize(file)
+            structure["meshes"].append({"voxel_size": voxel_size, "offset": data_size, "size": size,
+                                        "vertex_count": n_verts, "face_count": n_faces})
+            blobs.append((data_size, file))
+            data_size = _aligned(data_size + size)
+        structures.append(structure)
+
+    index = json.dumps({"resolution": list(resolution), "structures": structures}).encode("utf-8")
+    data_offset = _aligned(HEADER.size + len(index))
+    # Through a temporary file, so a crash never leaves a truncated archive
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'wb') as archive:
+        archive.write(HEADER.pack(MAGIC, VERSION, len(index), data_offset))
+        archive.write(index)
+        for offset, file in blobs:
+            archive.seek(data_offset + offset)
+            with open(file, 'rb') as blob:
+                shutil.copyfileobj(blob, archive)
+    os.replace(temporary_path, path)
+
+
+class AtlasArchive(object):
+    """Reader of the archive: the index is read once, the meshes are memory-mapped on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as archive:
+            magic, version, index_size, self.data_offset = HEADER.unpack(archive.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not an atlas archive".format(path))
+            if version != VERSION:
+                raise ValueError("Unsupported atlas archive version {} in {}".format(version, path))
+            index = json.loads(archive.read(index_size).decode("utf-8"))
+        self.resolution = tuple(index["resolution"])
+        self.structures = {structure["id"]: structure for structure in index["structures"]}
+
+    def children(self, structure_id):
+        """Ids of the archived structures whose parent is the given structure"""
+        return [structure["id"] for structure in self.structures.values() if structure["parent_id"] == structure_id]
+
+    def voxel_sizes(self, structure_id):
+        return [mesh["voxel_size"] for mesh in self.structures[structure_id]["meshes"]]
+
+    def _offset(self, structure_id, voxel_size):
+        meshes = self.structures[structure_id]["meshes"]
+        if voxel_size is None:
+            voxel_size = min(mesh["voxel_size"] for mesh in meshes)
+        for mesh in meshes:
+            if mesh["voxel_size"] == voxel_size:
+                return self.data_offset + mesh["offset"]
+        raise KeyError("No {} um mesh for structure {}".format(voxel_size, structure_id))
+
+    def mesh(self, structure_id, voxel_size=None, mmap=True):
+        """(verts, faces) of the structure at the given voxel size, the full resolution by default"""
+        return read_mesh(self.path, self._offset(structure_id, voxel_size), mmap)
+
+    def normals(self, structure_id, voxel_size=None, mmap=True):
+        """Vertex normals of the mesh (see mesh), None if it was exported without"""
+        return read_normals(self.path, self._offset(structure_id, voxel_size), mmap)
@@ -0,0 +1,136 @@
+#    Times the structure export on a synthetic annotation volume, fully offline
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# Usage: python export_benchmark.py [--shape 264 160 228] [--structures 60] [--workers 1 4]
+# The atlas is made of nested ellipsoids: every top level structure holds a chain
+# of smaller ones, the annotation giving each voxel its deepest structure
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from skimage.draw import ellipsoid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import brain_structures_export
+from brain_structures_export import export_obj, export_structures
+from label_index import LabelIndex
+from structure_index import build_structure_index, structure_directory
+from instrumentation import StageTimer, peak_rss_mb
+
+
+def synthetic_atlas(shape, n_structures, depth=3, seed=0):
+    """(annotation, structure graph) of n_structures nested ellipsoids under a root structure"""
+    random = np.random.RandomState(seed)
+    shape = np.array(shape)
+    annotation = np.zeros(tuple(shape), dtype=np.uint32)
+    graph = [{"id": 997, "acronym": "root", "name": "root", "structure_id_path": [997]}]
+    for number in range(n_structures):
+        structure_id = 1000 + number
+        level = number % depth
+        if level == 0:
+            radii = (shape * random.uniform(0.06, 0.2, 3)).astype(int) + 2
+            center = np.array([random.randint(radius, size - radius) for radius, size in zip(radii, shape)])
+            path = [997]
+        else:
+            # Nested in the previous structure, off its center
+            radii = (radii * 0.6).astype(int) + 1
+            center = center + (random.uniform(-0.3, 0.3, 3) * radii).astype(int)
+        path = path + [structure_id]
+        solid = ellipsoid(*radii)[1:-1, 1:-1, 1:-1]
+        lower = center - radii
+        region = annotation[lower[0]:lower[0]+solid.shape[0], lower[1]:lower[1]+solid.shape[1],
+                            lower[2]:lower[2]+solid.shape[2]]
+        region[solid[:region.shape[0], :region.shape[1], :region.shape[2]]] = structure_id
+        graph.append({"id": structure_id, "acronym": "S" + str(number), "name": "Structure " + str(number),
+                      "structure_id_path": path})
+    return annotation, graph
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def format_rss(megabytes):
+    return "n/a" if megabytes is None else "{:.0f} MB".format(megabytes)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the structure export on a synthetic atlas")
+    parser.add_argument("--shape", type=int, nargs=3, default=[264, 160, 228],
+                        help="annotation shape (AP, ML, DV), the 50 um atlas by default")
+    parser.add_argument("--structures", type=int, default=60, help="number of synthetic structures")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="worker counts to time the whole export with")
+    parser.add_argument("--brick-size", type=int, default=256, help="brick size of the chunked meshing")
+    parser.add_argument("--lod-sizes", type=int, nargs="*", default=[], help="LOD voxel sizes (microns)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    resolution = 50
+    annotation, structure_graph = synthetic_atlas(args.shape, args.structures, seed=args.seed)
+    print("Synthetic atlas: shape {}, {} structures".format(annotation.shape, len(structure_graph)))
+
+    index, index_time = timed(LabelIndex, annotation, structure_graph, [resolution]*3)
+    brain_structures_export.label_index = index
+    print("Label index:    {:.2f} s".format(index_time))
+    with tempfile.TemporaryDirectory() as store_dir:
+        # What later runs on the same annotation do instead of the scan
+        store_path = os.path.join(store_dir, "label_index.npz")
+        _, save_time = timed(index.save, store_path)
+        _, load_time = timed(LabelIndex.load, store_path, structure_graph, [resolution]*3)
+        print("Index store:    {:.2f} s save, {:.2f} s load, {:.1f} MB".format(
+            save_time, load_time, os.path.getsize(store_path) / 2.0**20))
+
+    structure_index = build_structure_index(structure_graph)
+    options = {"hemisphere": "left", "binary": True, "brick_size": args.brick_size,
+               "lod_sizes": args.lod_sizes}
+
+    with tempfile.TemporaryDirectory() as output_root:
+        # Stage timings, one structure after the other in this process
+        timer = StageTimer()
+        start = time.perf_counter()
+        for struct in structure_graph:
+            export_obj(struct["id"], structure_index[struct["id"]]["name"],
+                       structure_directory(structure_index, struct["id"], os.path.join(output_root, "stages")),
+                       timer=timer, **options)
+        total = time.perf_counter() - start
+        print("Stages (single process, {:.2f} s total):".format(total))
+        for stage, seconds in sorted(timer.timings.items(), key=lambda item: -item[1]):
+            print("  {:<12} {:8.2f} s  {:5.1f} %".format(stage, seconds, 100 * seconds / total))
+
+        # Whole export loop, as run by main()
+        for workers in args.workers:
+            root = os.path.join(output_root, "workers_" + str(workers))
+            jobs = [(struct["id"], structure_index[struct["id"]]["name"],
+                     structure_directory(structure_index, struct["id"], root)) for struct in structure_graph]
+            # Without the line printed for every structure
+            with contextlib.redirect_stdout(io.StringIO()):
+                report, seconds = timed(export_structures, jobs, workers, **options)
+            exported = sum(entry["status"] == "exported" for entry in report)
+            print("export_structures, {} worker(s): {:.2f} s, {:.1f} structures/s ({} exported)".format(
+                workers, seconds, len(jobs) / seconds, exported))
+
+    print("Peak RSS: {} (main process), {} (largest worker)".format(
+        format_rss(peak_rss_mb()), format_rss(peak_rss_mb(children=True))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#    Compares obj_writer.write_obj to the per-vertex loop export_obj used to run
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# Usage: python obj_writer_benchmark.py [radius]
+# The mesh is the surface of an ellipsoid of the given radius (in voxels)
+
+import os
+import sys
+import time
+import tempfile
+
+from skimage.draw import ellipsoid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from obj_writer import write_obj
+from chunked_meshing import marching_cubes
+
+
+def write_obj_loop(path, verts, faces):
+    """The writing loop of the original export_obj"""
+    with open(path,'w') as file:
+        for vert in verts:
+            file.write("v "+str(vert[0])+" "+str(vert[1])+" "+str(vert[2])+"\n")
+        for face in faces:
+            file.write("f "+str(face[0]+1)+" "+str(face[1]+1)+" "+str(face[2]+1)+"\n")
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def main():
+    radius = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    volume = ellipsoid(radius, int(radius*0.8), int(radius*0.6))
+    verts, faces = marching_cubes(volume, 0)
+    print("Mesh: {} vertices, {} faces".format(len(verts), len(faces)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        loop_path = os.path.join(directory, "loop.obj")
+        bulk_path = os.path.join(directory, "bulk.obj")
+        loop_time = timed(write_obj_loop, loop_path, verts, faces)
+        bulk_time = timed(write_obj, bulk_path, verts, faces)
+        with open(loop_path, 'rb') as loop_file, open(bulk_path, 'rb') as bulk_file:
+            identical = loop_file.read() == bulk_file.read()
+
+    print("Per-vertex loop: {:.2f} s".format(loop_time))
+    print("write_obj:       {:.2f} s ({:.1f}x faster)".format(bulk_time, loop_time / bulk_time))
+    print("Identical files: {}".format(identical))
+
+if __name__ == "__main__":
+    main()
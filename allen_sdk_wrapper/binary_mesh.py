@@ -0,0 +1,83 @@
+#    Compact mesh files written next to the .obj export
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# A .bbm file is a 24 bytes little-endian header:
+#     magic (8 bytes, b"BBMESH\0\0"), version, vertex count, face count, flags (uint32 each)
+# followed by the vertices as float32 (x, y, z) and the faces as uint32 (a, b, c), 0-based.
+# With the FLAG_NORMALS bit of flags, one float32 normal (x, y, z) per vertex follows the faces.
+# The readers in the Blender add-ons (BrainBlender_Tree_Import) follow the same layout.
+
+import struct
+import numpy as np
+
+BINARY_EXTENSION = ".bbm"
+MAGIC = b"BBMESH\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+FLAG_NORMALS = 1
+
+
+def write_mesh(path, verts, faces, normals=None):
+    """Write the mesh in the binary format, with its vertex normals if given"""
+    write_mesh_chunks(path, len(verts), len(faces), [verts], [faces], None if normals is None else [normals])
+
+def write_mesh_chunks(path, n_verts, n_faces, vert_chunks, face_chunks, normal_chunks=None):
+    """Write the mesh given as consecutive chunks of vertices, faces and normals, the counts being known"""
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, n_verts, n_faces, 0 if normal_chunks is None else FLAG_NORMALS))
+        for verts in vert_chunks:
+            file.write(np.ascontiguousarray(verts, dtype="<f4").tobytes())
+        for faces in face_chunks:
+            file.write(np.ascontiguousarray(faces, dtype="<u4").tobytes())
+        for normals in normal_chunks or []:
+            file.write(np.ascontiguousarray(normals, dtype="<f4").tobytes())
+
+def read_header(path, offset=0):
+    """(vertex count, face count, flags) of the mesh stored at offset in the file"""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        magic, version, n_verts, n_faces, flags = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("{} is not a binary mesh file".format(path))
+    if version != VERSION:
+        raise ValueError("Unsupported binary mesh version {} in {}".format(version, path))
+    return n_verts, n_faces, flags
+
+def read_mesh(path, offset=0, mmap=True):
+    """(verts, faces) arrays of the mesh, memory-mapped read-only unless mmap is False"""
+    n_verts, n_faces, flags = read_header(path, offset)
+    verts_offset = offset + HEADER.size
+    faces_offset = verts_offset + n_verts * 3 * 4
+    if mmap and n_verts and n_faces: # numpy cannot map empty arrays
+        verts = np.memmap(path, dtype="<f4", mode='r', offset=verts_offset, shape=(n_verts, 3))
+        faces = np.memmap(path, dtype="<u4", mode='r', offset=faces_offset, shape=(n_faces, 3))
+    else:
+        with open(path, 'rb') as file:
+            file.seek(verts_offset)
+            verts = np.fromfile(file, dtype="<f4", count=n_verts * 3).reshape(n_verts, 3)
+            faces = np.fromfile(file, dtype="<u4", count=n_faces * 3).reshape(n_faces, 3)
+    return verts, faces
+
+def read_normals(path, offset=0, mmap=True):
+    """Vertex normals of the mesh, None if it was written without"""
+    n_verts, n_faces, flags = read_header(path, offset)
+    if not flags & FLAG_NORMALS:
+        return None
+    normals_offset = offset + HEADER.size + n_verts * 3 * 4 + n_faces * 3 * 4
+    if mmap and n_verts:
+        return np.memmap(path, dtype="<f4", mode='r', offset=normals_offset, shape=(n_verts, 3))
+    with open(path, 'rb') as file:
+        file.seek(normals_offset)
+        return np.fromfile(file, dtype="<f4", count=n_verts * 3).reshape(n_verts, 3)
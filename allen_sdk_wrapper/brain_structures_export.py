@@ -17,78 +17,487 @@
 
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 
-from skimage import measure
 from skimage.draw import ellipsoid
 
-from allensdk.core.reference_space import ReferenceSpace
-from allensdk.api.queries.mouse_connectivity_api import MouseConnectivityApi
-from allensdk.config.manifest import Manifest
-from allensdk.api.queries.ontologies_api import OntologiesApi
-from allensdk.core.structure_tree import StructureTree
-
 import os
-import nrrd
+import csv
+import time
+import argparse
+import threading
 import numpy as np
+from multiprocessing import Pool, cpu_count, current_process
+
+from label_index import cached_label_index
+from structure_index import build_structure_index, structure_directory, write_structure_index
+from allen_cache import AllenCache
+from obj_writer import write_obj
+from binary_mesh import write_mesh, BINARY_EXTENSION
+from export_manifest import ExportManifest
+from lod import lod_factor, lod_path, downsample_mask, coarse_to_fine, write_lod_index
+from chunked_meshing import marching_cubes, marching_cubes_chunked, brick_meshes, downsample_chunked
+from mesh_stream import MeshSpool
+from surface_nets import SurfaceNet
+from atlas_archive import write_atlas
+from mesh_processing import process_mesh, mirror, vertex_normals
+from instrumentation import StageTimer, ExportLog, read_log, latest_records, summarize
+from structure_statistics import mask_statistics, surface_area, write_statistics
 
 # Need to download http://help.brain-map.org/display/mouseconnectivity/API
 
-def export_obj(structure_id, name, path):
-    """Export given structure id to the give path"""
+label_index = None # LabelIndex used by export_obj, set in main() or in the pool workers
+surface_net = None # SurfaceNet used by export_obj with surface_nets, set in the same places
+HEMISPHERES = ("left", "right", "both", "mirrored")
+ALLEN_RESOLUTIONS = (10, 25, 50, 100) # Microns, the annotation volumes the Allen API serves
+
+def hemisphere_range(hemisphere, width):
+    """(start, stop) kept along the medio-lateral axis of the given width; the cut is at the midline
+
+    A mirrored export meshes the left hemisphere.
+    """
+    if hemisphere in ("left", "mirrored"):
+        return 0, width // 2
+    if hemisphere == "right":
+        return width // 2, width
+    if hemisphere == "both":
+        return 0, width
+    raise ValueError("Unknown hemisphere {}, expected one of {}".format(hemisphere, HEMISPHERES))
+
+def write_mesh_files(obj_path, verts, faces, binary=False, normals=False):
+    """Write the mesh as .obj (and .bbm with binary), with its vertex normals if asked, returns the written files"""
+    written = [obj_path]
+    # From the final faces: the marching cubes normals do not survive welding, simplification or mirroring
+    vertex_normal_array = vertex_normals(verts, faces) if normals else None
+    write_obj(obj_path, verts, faces, normals=vertex_normal_array)
+    if binary:
+        written.append(obj_path[:-4]+BINARY_EXTENSION)
+        write_mesh(written[-1], verts, faces, vertex_normal_array)
+    return written
+
+def stream_mesh_files(mask, lower, upper, brick_size, obj_path, binary=False, timer=None, statistics=None,
+                      normals=False):
+    """Mesh the box [lower, upper) brick by brick, each brick mesh going straight to disk (see mesh_stream)
+
+    Returns the written files, empty if there is no surface. The same mesh as
+    marching_cubes_chunked, up to the order of the vertices.
+    """
+    timer = timer or StageTimer()
+    area = 0.0
+    with MeshSpool(normals=normals) as spool:
+        with timer.stage("meshing"):
+            for verts, faces, shared in brick_meshes(mask, lower, upper, 0, brick_size):
+                spool.add(verts, faces, shared)
+                if statistics is not None:
+                    area += surface_area(verts, faces, label_index.resolution)
+                del verts, faces, shared
+        if not spool.n_faces:
+            return []
+        with timer.stage("writing"):
+            # exist_ok as several workers may create the same parent directory
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            written = spool.write(obj_path, binary)
+    if statistics is not None:
+        statistics.update(surface_area_mm2=area, vertex_count=spool.n_verts, face_count=spool.n_faces)
+    return written
+
+def export_obj(structure_id, name, path, hemisphere="left", binary=False, lod_sizes=(), brick_size=None, postprocess=None,
+               mask=None, timer=None, statistics=None, surface_nets=False, normals=False):
+    """Export given structure id to the give path, returns the written files (empty if no surface)
+
+    hemisphere is "left", "right" or "both"; a single hemisphere mesh is left open at the midline
+    With "mirrored", the left hemisphere mesh is reflected about the midline, between the last left
+    column and the first right one, and welded to its reflection, instead of meshing both sides:
+    only for symmetric annotations
+
+    With binary, the mesh is also written in the compact binary format (.bbm) next to the .obj
+    With normals, the vertex normals are written in both formats, for smooth shading on import
+    lod_sizes are voxel sizes (microns, multiples of the resolution, checked first) of coarser meshes
+    written as "name.lod<size>.obj" from the same mask
+    With brick_size, structures larger than a brick are meshed brick by brick (see chunked_meshing)
+    and, unless post-processed or mirrored, written to disk while they are meshed (see mesh_stream)
+    postprocess are the process_mesh arguments (weld, target_faces, max_error, smooth_iterations)
+    applied to every mesh before writing
+    mask is the RunLengthMask of the structure when already built, otherwise it comes from the label index
+    With surface_nets, the mesh is cut out of the surface net of the whole annotation (built for the
+    same hemisphere) instead of running marching cubes: adjacent structures share their interface
+    timer is a StageTimer receiving the time of the mask, meshing, postprocess,
+    mirror, writing and lod stages
+    statistics is a dict receiving the structure statistics (see structure_statistics) of the
+    meshed hemisphere (both sides when mirrored), the surface area and vertex and face counts
+    being the ones of the full resolution mesh written
+    """
 #    acronym = tree.get_structures_by_id([structure_id])[0]["acronym"]
 #    acronym = acronym.replace("/","-")
-    structure_mask = rsp.make_structure_mask([structure_id])
-    half_mask = structure_mask[:,:228,:]
-#    half_mask[:,228,:] = 0
+    timer = timer or StageTimer()
+    # Checked before anything is written, a bad size must not leave a half exported structure
+    lod_factors = [lod_factor(size, label_index.resolution) for size in lod_sizes]
+    with timer.stage("mask"):
+        if mask is None:
+            mask = label_index.structure_mask(structure_id)
+        start, stop = hemisphere_range(hemisphere, label_index.shape[1])
+        if statistics is not None:
+            # Of the part of the structure that is meshed: one hemisphere unless mirrored
+            meshed = mask if hemisphere == "mirrored" else mask.clipped(
+                (0, start, 0), (label_index.shape[0], stop, label_index.shape[2]))
+            statistics.update(mask_statistics(meshed, label_index.resolution))
+            del meshed
+        box = mask.bounding_box()
+        if box is None:
+            return []
+        # Tight box around the structure with a one voxel pad, cut to the hemisphere:
+        # the surface is the same as on the whole hemisphere volume, only shifted by lower
+        lower = np.maximum(box[0] - 1, (0, start, 0))
+        upper = np.minimum(box[1] + 1, (label_index.shape[0], stop, label_index.shape[2]))
+        if np.any(upper - lower < 2):
+            return []
+        chunked = brick_size is not None and np.any(upper - lower > brick_size)
+        mirrored = hemisphere == "mirrored"
+        # main passes all the options, most often all off
+        postprocessed = bool(postprocess) and any(postprocess.values())
+        # Large meshes that are not changed as a whole afterwards are written while they are meshed
+        streamed = chunked and not mirrored and not surface_nets and not postprocessed
+        # In chunked mode the bricks are densified while meshing, the surface nets only need it for the LODs
+        half_mask = None if chunked or (surface_nets and not lod_sizes) else mask.cropped(lower, upper)
+
+    if streamed:
+        written = stream_mesh_files(mask, lower, upper, brick_size, path+name+".obj", binary, timer, statistics,
+                                    normals)
+        if not written:
+            return []
+    else:
+        with timer.stage("meshing"):
+            if surface_nets:
+                mesh = surface_net.structure_mesh(label_index.labels(structure_id))
+                if mesh is None:
+                    return []
+                verts, faces = mesh
+            elif chunked:
+                # Only one brick is dense at a time
+                mesh = marching_cubes_chunked(mask, lower, upper, 0, brick_size)
+                if mesh is None:
+                    return []
+                verts, faces = mesh
+            else:
+#            half_mask[:,228,:] = 0
+                try:
+                    verts, faces = marching_cubes(half_mask, 0)
+                except (RuntimeError):
+                    return []
+                verts += lower
+
+        if postprocessed:
+            with timer.stage("postprocess"):
+                verts, faces = process_mesh(verts, faces, **postprocess)
+
+        if mirrored:
+            # After the post-processing, which keeps the cut on its plane, so it runs on half the mesh
+            with timer.stage("mirror"):
+                # The surface net is cut on the midline, the marching cubes mesh on the last left column
+                verts, faces = mirror(verts, faces, stop - 0.5, None if surface_nets else stop - 1)
+
+        with timer.stage("writing"):
+            # exist_ok as several workers may create the same parent directory
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            written = write_mesh_files(path+name+".obj", verts, faces, binary, normals)
+            if statistics is not None:
+                statistics.update(surface_area_mm2=surface_area(verts, faces, label_index.resolution),
+                                  vertex_count=len(verts), face_count=len(faces))
+            del verts, faces
+
+    with timer.stage("lod"):
+        for size, factor in zip(lod_sizes, lod_factors):
+            # Empty blocks around, but the hemisphere cut stays open as in the full resolution mesh
+            open_start = start > 0 and lower[1] == start
+            open_stop = stop < label_index.shape[1] and upper[1] == stop
+            pad = [(1, 1), (0 if open_start else 1, 0 if open_stop else 1), (1, 1)]
+            # Mirrored, the blocks end on the midline so they are reflected onto the right ones
+            lod_lower = lower.copy()
+            if mirrored and open_stop:
+                lod_lower[1] = stop - -(-(stop - lower[1]) // factor) * factor
+            if chunked:
+                occupancy = downsample_chunked(mask, lod_lower, upper, factor, brick_size)
+            elif lod_lower[1] < lower[1]:
+                occupancy = downsample_mask(np.pad(half_mask, [(0, 0), (lower[1] - lod_lower[1], 0), (0, 0)],
+                                                   mode='constant'), factor)
+            else:
+                occupancy = downsample_mask(half_mask, factor)
+            occupancy = np.pad(occupancy, pad, mode='constant')
+            try:
+                verts, faces = marching_cubes(occupancy, 0.5)
+            except (RuntimeError, ValueError):
+                continue # The structure vanishes at this level
+            verts = coarse_to_fine(verts - [before for before, after in pad], factor) + lod_lower
+            if postprocessed:
+                verts, faces = process_mesh(verts, faces, **postprocess)
+            if mirrored:
+                # As the full resolution mesh, about the midline; the open cut is on the centers of the last blocks
+                verts, faces = mirror(verts, faces, stop - 0.5, stop - (factor + 1) / 2.0 if open_stop else None)
+            written += write_mesh_files(lod_path(path+name+".obj", size), verts, faces, binary, normals)
+    return written
+
+def _init_worker(index, net=None):
+    """Give the pool worker the LabelIndex and SurfaceNet used by export_obj"""
+    # With fork they are inherited copy-on-write and only read
+    global label_index, surface_net
+    label_index = index
+    surface_net = net
+
+def _export_job(job):
+    """Run export_obj for one job and turn the outcome into a report entry, with its timings"""
+    order, struct_id, name, path, options = job
+    timer = StageTimer()
+    entry = {"order": order, "id": struct_id, "name": name, "files": [], "status": "", "error": "", "statistics": {},
+             "worker": current_process().name, "timings": timer.timings}
+    start = time.perf_counter()
+    try:
+        written = export_obj(struct_id, name, path, timer=timer, statistics=entry["statistics"], **options)
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = repr(e)
+        entry["statistics"] = {}
+        return entry
+    finally:
+        entry["seconds"] = time.perf_counter() - start
+    entry["status"] = "exported" if written else "empty"
+    entry["files"] = written
+    return entry
+
+def export_parameters(options):
+    """Everything besides the annotation that changes the exported files"""
+    params = dict(options)
+    params["resolution"] = list(label_index.resolution)
+    return params
+
+def export_structures(jobs, workers=1, manifest=None, bottom_up=False, log=None, **options):
+    """Export the (structure_id, name, path) jobs, one report entry per structure in job order
+
+    With workers > 1 the structures are exported concurrently by a process pool.
+    With a manifest, structures whose voxels, parameters and files are unchanged
+    since the last run are skipped, and every finished structure is recorded.
+    With bottom_up, the structures are exported from the leaves to the root, each
+    mask being the union of the already built masks of its children.
+    With an ExportLog, every finished structure is logged with its timings, and every
+    skipped one with the files and statistics of the manifest.
+    The options are passed to export_obj.
+    """
+    jobs = [(order,) + tuple(job) + (options,) for order, job in enumerate(jobs)]
+    report = []
+    if manifest is not None:
+        params = export_parameters(options)
+        checksums = {job[1]: label_index.checksum(job[1]) for job in jobs}
+        if options.get("surface_nets"):
+            # A net vertex is placed from every label of its cell, so a mesh also changes with
+            # its neighbours: any change of the annotation makes every structure stale
+            volume_checksum = label_index.volume_checksum()
+            checksums = {struct_id: checksum + ":" + volume_checksum for struct_id, checksum in checksums.items()}
+        stale_jobs = []
+        for job in jobs:
+            order, struct_id, name = job[:3]
+            if manifest.is_current(struct_id, checksums[struct_id], params):
+                report.append({"order": order, "id": struct_id, "name": name, "files": manifest.files(struct_id),
+                               "status": "skipped", "error": "", "statistics": manifest.statistics(struct_id)})
+                if log is not None:
+                    log.write(report[-1])
+            else:
+                stale_jobs.append(job)
+        jobs = stale_jobs
+
+    def collect(entry):
+        print(entry["status"], entry["name"])
+        report.append(entry)
+        if log is not None:
+            log.write(entry)
+        if manifest is not None:
+            if entry["status"] == "failed":
+                manifest.forget(entry["id"])
+            else:
+                manifest.record(entry["id"], checksums[entry["id"]], params, entry["files"], entry["statistics"])
+            manifest.save()
+
+    # The pool reads the jobs ahead, at most 2 per worker are waiting so the masks built
+    # bottom-up are not all held in memory at once
+    in_flight = threading.Semaphore(2 * max(workers, 1))
+    cancelled = threading.Event()
+    def job_stream():
+        if not bottom_up:
+            for job in jobs:
+                in_flight.acquire()
+                if cancelled.is_set():
+                    return
+                yield job
+            return
+        stale_jobs = {job[1]: job for job in jobs}
+        for struct_id, mask in label_index.bottom_up_masks(list(stale_jobs)):
+            order, struct_id, name, path, job_options = stale_jobs[struct_id]
+            in_flight.acquire()
+            if cancelled.is_set():
+                return
+            yield order, struct_id, name, path, dict(job_options, mask=mask)
+
+    if workers <= 1:
+        for entry in map(_export_job, job_stream()):
+            in_flight.release()
+            collect(entry)
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(label_index, surface_net))
+        try:
+            for entry in pool.imap_unordered(_export_job, job_stream()):
+                in_flight.release()
+                collect(entry)
+        except BaseException:
+            # The pool thread feeding the jobs may wait on in_flight: wake it up to stop,
+            # otherwise terminate (and join) would wait for it forever
+            cancelled.set()
+            in_flight.release()
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    report.sort(key=lambda entry: entry["order"])
+    return report
+
+def write_report(report, path):
+    """Write the export report as a csv file"""
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "name", "status", "files", "error"])
+        for entry in report:
+            writer.writerow([entry["id"], entry["name"], entry["status"], ";".join(entry["files"]), entry["error"]])
+
+def select_structures(structure_graph, ids=(), acronyms=(), subtrees=(), max_depth=None):
+    """Structures of the graph picked by id, by acronym or as part of a subtree (root id or acronym)
+
+    Without ids, acronyms or subtrees every structure is selected. max_depth keeps only the
+    structures at most that many levels below the subtree roots (below the ontology root
+    if no subtree is given). The graph order is kept.
+    """
+    by_acronym = {struct["acronym"]: struct["id"] for struct in structure_graph}
+    def to_id(key):
+        key = str(key)
+        if key.isdigit():
+            return int(key)
+        if key not in by_acronym:
+            raise ValueError("Unknown structure acronym {}".format(key))
+        return by_acronym[key]
+
+    picked = set(to_id(key) for key in ids) | set(to_id(key) for key in acronyms)
+    roots = set(to_id(key) for key in subtrees)
+    select_all = not picked and not roots
+
+    selection = []
+    for struct in structure_graph:
+        path = struct["structure_id_path"]
+        if select_all:
+            depth = len(path) - 1
+        elif struct["id"] in picked:
+            depth = 0
+        else:
+            depths = [len(path) - 1 - path.index(root) for root in roots if root in path]
+            if not depths:
+                continue
+            depth = min(depths)
+        if max_depth is None or depth <= max_depth:
+            selection.append(struct)
+    return selection
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Export Allen brain structures as meshes, organized in a tree of acronyms")
+    parser.add_argument("output_root", help="directory where the mesh tree is written")
+    parser.add_argument("--cache-dir", required=True, help="directory of the cached structure graph and annotation volumes")
+    parser.add_argument("--offline", action="store_true", help="only use the cache, never query the Allen API")
+    parser.add_argument("--graph-id", type=int, default=1, help="structure graph, 1 is the adult mouse (default)")
+    parser.add_argument("--resolution", type=int, default=10, help="annotation resolution in microns (10, 25, 50 or 100)")
+    parser.add_argument("--source-resolution", type=int,
+                        help="resample the annotation at this resolution to --resolution (any coarser size) instead of downloading it")
+    parser.add_argument("--hemisphere", default="left", choices=HEMISPHERES,
+                        help="part of the brain meshed (default left), mirrored reflects the left hemisphere")
+    parser.add_argument("--ids", nargs="+", type=int, default=[], help="structure ids to export")
+    parser.add_argument("--acronyms", nargs="+", default=[], help="structure acronyms to export")
+    parser.add_argument("--subtrees", nargs="+", default=[], help="ids or acronyms of structures exported with all their descendants")
+    parser.add_argument("--max-depth", type=int, help="maximum depth below the subtree roots (or the ontology root)")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="number of export processes (default: one per core)")
+    parser.add_argument("--brick-size", type=int, default=256,
+                        help="structures larger than this (voxels) are meshed in bricks to bound the memory (default 256)")
+    parser.add_argument("--weld", action="store_true", help="merge duplicated vertices and drop degenerate faces")
+    parser.add_argument("--target-faces", type=int, help="simplify each mesh to at most this many faces")
+    parser.add_argument("--max-error", type=float, help="simplify each mesh, moving vertices by at most about this (voxels)")
+    parser.add_argument("--smooth", type=int, default=0, metavar="ITERATIONS", help="Taubin smoothing iterations")
+    parser.add_argument("--surface-nets", action="store_true",
+                        help="mesh all the structures from one multi-label sweep, adjacent structures sharing their interface")
+    parser.add_argument("--bottom-up", action="store_true", help="build each parent mask from its children's masks, leaves first")
+    parser.add_argument("--no-binary", dest="binary", action="store_false", help="do not write the .bbm binary meshes")
+    parser.add_argument("--no-normals", dest="normals", action="store_false", help="do not write the vertex normals")
+    parser.add_argument("--lod-sizes", nargs="*", type=int, default=[], help="voxel sizes (microns) of coarser levels of detail")
+    parser.add_argument("--atlas", action="store_true", help="also pack all the binary meshes into a single atlas.bba file")
+    args = parser.parse_args(argv)
+    if args.source_resolution is None and args.resolution not in ALLEN_RESOLUTIONS:
+        parser.error("The Allen annotation is available at {} um, use --source-resolution to resample it".format(
+            ", ".join(map(str, ALLEN_RESOLUTIONS))))
+    if args.source_resolution is not None and args.resolution < args.source_resolution:
+        parser.error("--resolution must be coarser than --source-resolution")
+    if args.atlas and not args.binary:
+        parser.error("--atlas packs the binary meshes, it cannot be used with --no-binary")
+    if any(size <= 0 or size % args.resolution for size in args.lod_sizes):
+        parser.error("--lod-sizes must be multiples of --resolution ({} um)".format(args.resolution))
+    return args
+
+def main(argv=None, api=None):
+    """Run the export with the command line arguments; api replaces the Allen API (see allen_cache.LocalAllenApi)"""
+    global label_index, surface_net
+    args = parse_arguments(argv)
+
+    # The structure graph and annotation downloads are kept in the cache, the API is only queried on a miss
+    cache = AllenCache(args.cache_dir, api=api, offline=args.offline)
+
+    structure_graph = cache.structure_graph(args.graph_id)
+    # Names and directories of every structure, instead of StructureTree lookups per ancestor
+    structure_index = build_structure_index(structure_graph)
+
+    # Swapped and DV-flipped annotation of the latest ccf version, memory-mapped from its .npy copy
+    # (or from the cached resampling of the source resolution one)
+    swapped_ann = cache.annotation(args.resolution, args.source_resolution)
+
+    # Scan the annotation once, every structure mask is then built from this index.
+    # The index is stored in the cache, later runs on the same annotation only read it
+    label_index = cached_label_index(swapped_ann, structure_graph, [args.resolution] * 3,
+                                     os.path.join(args.cache_dir, "label_index"))
+    if args.surface_nets:
+        # The interfaces between all the labels, in one more sweep
+        surface_net = SurfaceNet(swapped_ann, hemisphere_range(args.hemisphere, swapped_ann.shape[1]))
+
+    ##Here comes the obj creation
+    jobs = []
+    for struct in select_structures(structure_graph, args.ids, args.acronyms, args.subtrees, args.max_depth):
+        struct_id = struct["id"]
+        jobs.append((struct_id, structure_index[struct_id]["name"],
+                     structure_directory(structure_index, struct_id, args.output_root)))
+
+    os.makedirs(args.output_root, exist_ok=True)
+    write_structure_index(structure_index, os.path.join(args.output_root, "structure_index.json"))
+    # Re-runs only export what is missing or stale in the manifest
+    manifest = ExportManifest(os.path.join(args.output_root, "export_manifest.json"))
+    # Sizes, timings and worker of every structure, one JSON line each
+    log = ExportLog(os.path.join(args.output_root, "export_log.jsonl"))
     try:
-        verts, faces, normals, values = measure.marching_cubes_lewiner(half_mask, 0)
-    except (RuntimeError):
-        return
-
-    if not os.path.exists(os.path.dirname(path)):
-        os.makedirs(os.path.dirname(path))
-    with open(path+name+".obj",'w') as file:
-        for vert in verts:
-            file.write("v "+str(vert[0])+" "+str(vert[1])+" "+str(vert[2])+"\n")
-        for face in faces:
-            file.write("f "+str(face[0]+1)+" "+str(face[1]+1)+" "+str(face[2]+1)+"\n")
-
-graph_id = 1 # Graph_id is the id of the structure we want to load. 1 is the id of the adult mouse structure graph
-
-oapi = OntologiesApi()
-structure_graph = oapi.get_structures_with_sets([graph_id])
-# This removes some unused fields returned by the query
-structure_graph = StructureTree.clean_structures(structure_graph)
-tree = StructureTree(structure_graph)
-
-# the annotation download writes a file, so we will need somwhere to put it
-annotation_dir = 'E:\\Histology\\allen_rsp'
-
-annotation_path = os.path.join(annotation_dir, 'annotation_10.nrrd')
-
-# this is a string which contains the name of the latest ccf version
-annotation_version = MouseConnectivityApi.CCF_VERSION_DEFAULT
-
-mcapi = MouseConnectivityApi()
-#Next line commented because the annotation volume is already downloaded
-mcapi.download_annotation_volume(annotation_version, 10, annotation_path)
-
-annotation, meta = nrrd.read(annotation_path)
-
-swapped_ann = np.swapaxes(annotation,1,2)
-swapped_ann = swapped_ann[:,:,::-1] #Revert the z axis so the 0 is the ventral part
-
-rsp = ReferenceSpace(tree, swapped_ann, [10, 10, 10])
-
-root_path = "E:\\Histology\\brain_structures_half_not_close_10\\"
-##Here comes the obj creation
-for struct in structure_graph[:1]:
-    path_parent = ""
-    for parent_id in struct["structure_id_path"][:-1]:
-        name_parent = tree.get_structures_by_id([parent_id])[0]["acronym"]
-        name_parent = name_parent.replace("/","-")
-        path_parent = path_parent + name_parent + "\\"
-    struct_id = struct["id"]
-    name = tree.get_structures_by_id([struct_id])[0]["name"] + " ("+ tree.get_structures_by_id([struct_id])[0]["acronym"] + ")"
-    name = name.replace("/","-")
-    export_obj(struct_id,name, root_path+path_parent)
-    print(struct["name"])
\ No newline at end of file
+        report = export_structures(jobs, args.workers, manifest, args.bottom_up, log, hemisphere=args.hemisphere,
+                                   binary=args.binary, lod_sizes=args.lod_sizes, brick_size=args.brick_size,
+                                   surface_nets=args.surface_nets, normals=args.normals,
+                                   postprocess={"weld": args.weld, "target_faces": args.target_faces,
+                                                "max_error": args.max_error, "smooth_iterations": args.smooth})
+    finally:
+        log.close()
+    # Of the whole export: the structures skipped by this run keep the timings logged by an earlier one
+    summary = summarize(latest_records(read_log(log.path)))
+    print(summary)
+    with open(os.path.join(args.output_root, "export_summary.txt"), 'w') as file:
+        file.write(summary + "\n")
+    write_report(report, os.path.join(args.output_root, "export_report.csv"))
+    write_lod_index(report, label_index.resolution, os.path.join(args.output_root, "lod_index.json"))
+    write_statistics(report, os.path.join(args.output_root, "structure_statistics.npz"))
+    if args.atlas:
+        # One file with every mesh and an index, read without walking the tree
+        write_atlas(os.path.join(args.output_root, "atlas.bba"), report, structure_index, label_index.resolution)
+
+if __name__ == "__main__":
+    main()
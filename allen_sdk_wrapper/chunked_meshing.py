@@ -0,0 +1,119 @@
+#    Marching cubes brick by brick, for structures too large to densify at once
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import itertools
+import numpy as np
+from skimage import measure
+
+from lod import downsample_mask
+
+# Newer scikit-image only has marching_cubes, which runs the same Lewiner algorithm by default
+_lewiner = getattr(measure, "marching_cubes_lewiner", None) or measure.marching_cubes
+
+
+def iter_bricks(lower, upper, brick_size, overlap=1):
+    """(brick lower, brick upper) covering the box [lower, upper)
+
+    Consecutive bricks share `overlap` voxels: with overlap=1 every marching
+    cubes cell (2x2x2 voxels) is in exactly one brick.
+    """
+    ranges = []
+    for low, up in zip(lower, upper):
+        starts = list(range(int(low), max(int(up) - overlap, int(low) + 1), brick_size - overlap))
+        ranges.append([(start, min(start + brick_size, int(up))) for start in starts])
+    for brick in itertools.product(*ranges):
+        yield np.array([b[0] for b in brick]), np.array([b[1] for b in brick])
+
+def marching_cubes(volume, level):
+    """(verts, faces) of the Lewiner marching cubes of the volume, faces wound outward
+
+    scikit-image winds the faces inward (its normals point outward): they are reversed,
+    so every mesh of the export, surface nets included, has the same orientation.
+    """
+    verts, faces = _lewiner(volume, level)[:2]
+    return verts, np.ascontiguousarray(faces[:, ::-1])
+
+def weld(verts, faces):
+    """Merge the vertices having exactly the same coordinates"""
+    unique_verts, inverse = np.unique(verts, axis=0, return_inverse=True)
+    return unique_verts, inverse.reshape(-1)[faces]
+
+def brick_meshes(mask, lower, upper, level=0, brick_size=256):
+    """Yield (verts, faces, shared) of the marching cubes of each brick of the box [lower, upper)
+
+    verts are in volume coordinates, without duplicates, and shared flags the vertices
+    lying on a face the brick shares with a neighbour brick, the only ones that can
+    also be in another brick.
+    Only one brick is dense at a time.
+    """
+    lower = np.asarray(lower)
+    upper = np.asarray(upper)
+    for brick_lower, brick_upper in iter_bricks(lower, upper, brick_size):
+        if np.any(brick_upper - brick_lower < 2):
+            continue
+        brick = mask.cropped(brick_lower, brick_upper)
+        if brick.all() or not brick.any():
+            continue
+        try:
+            verts, faces = marching_cubes(brick, level)
+        except (RuntimeError):
+            continue
+        del brick
+        # marching cubes jitters some vertices by about 1e-16 and, on a binary mask at level 0,
+        # gives coinciding vertices on the outside voxels: snapped and merged, the vertices of
+        # a shared face are exactly the same in both bricks
+        verts, faces = weld(np.round(verts, 4), faces)
+        shared = np.zeros(len(verts), dtype=bool)
+        for axis in range(3):
+            if brick_lower[axis] > lower[axis]:
+                shared |= verts[:, axis] == 0
+            if brick_upper[axis] < upper[axis]:
+                shared |= verts[:, axis] == brick_upper[axis] - brick_lower[axis] - 1
+        yield verts + brick_lower, faces, shared
+
+def marching_cubes_chunked(mask, lower, upper, level=0, brick_size=256):
+    """Marching cubes of the RunLengthMask inside the box [lower, upper), brick by brick
+
+    Only one brick is dense at a time, so the peak memory is bounded by the brick
+    size. The bricks overlap by one voxel and the vertices on their shared faces
+    are welded, giving the same watertight surface as a single marching cubes.
+    Returns (verts, faces) in volume coordinates, None if there is no surface.
+    """
+    all_verts, all_faces = [], []
+    n_verts = 0
+    for verts, faces, shared in brick_meshes(mask, lower, upper, level, brick_size):
+        all_verts.append(verts)
+        all_faces.append(faces + n_verts)
+        n_verts += len(verts)
+    if not all_verts:
+        return None
+    return weld(np.concatenate(all_verts), np.concatenate(all_faces))
+
+def downsample_chunked(mask, lower, upper, factor, brick_size=256):
+    """Fraction of each factor^3 block of the box [lower, upper) inside the mask (see lod.downsample_mask)
+
+    Computed brick by brick, the bricks being aligned on the blocks.
+    """
+    lower = np.asarray(lower)
+    size = np.asarray(upper) - lower
+    occupancy = np.zeros(tuple(-(-size // factor)), dtype=np.float32)
+    brick_size = max(factor, brick_size // factor * factor)
+    for brick_lower, brick_upper in iter_bricks(lower, upper, brick_size, overlap=0):
+        block = (brick_lower - lower) // factor
+        # As in downsample_mask, the voxels missing from a partial block at the upper end count as outside
+        coarse = downsample_mask(mask.cropped(brick_lower, brick_upper), factor)
+        occupancy[block[0]:block[0]+coarse.shape[0], block[1]:block[1]+coarse.shape[1],
+                  block[2]:block[2]+coarse.shape[2]] = coarse
+    return occupancy
@@ -0,0 +1,77 @@
+#    Records what was exported so an interrupted or re-run export skips the up to date structures
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import json
+import hashlib
+
+
+def file_checksum(path):
+    """sha1 of the file content"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ExportManifest(object):
+    """JSON file keeping, per structure id, the checksum of its annotation voxels,
+    the export parameters and the checksum of every file written for it"""
+
+    def __init__(self, path):
+        self.path = path
+        self.structures = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                self.structures = json.load(file)["structures"]
+
+    def is_current(self, structure_id, annotation_checksum, params):
+        """True if the structure was exported from the same voxels with the same
+        parameters and all its files are still on disk, unchanged"""
+        entry = self.structures.get(str(structure_id))
+        if entry is None or entry["annotation"] != annotation_checksum or entry["params"] != params:
+            return False
+        for path, checksum in entry["files"].items():
+            if not os.path.isfile(path) or file_checksum(path) != checksum:
+                return False
+        return True
+
+    def files(self, structure_id):
+        """Files recorded for the structure"""
+        return list(self.structures[str(structure_id)]["files"])
+
+    def statistics(self, structure_id):
+        """Statistics recorded for the structure (see structure_statistics), empty if none"""
+        return self.structures[str(structure_id)].get("statistics", {})
+
+    def record(self, structure_id, annotation_checksum, params, files, statistics=None):
+        """Record a successful export (files may be empty if the structure has no surface)"""
+        self.structures[str(structure_id)] = {
+            "annotation": annotation_checksum,
+            "params": params,
+            "files": {path: file_checksum(path) for path in files},
+            "statistics": statistics or {}}
+
+    def forget(self, structure_id):
+        """Mark the structure as stale, e.g. after a failed export"""
+        self.structures.pop(str(structure_id), None)
+
+    def save(self):
+        """Write the manifest, through a temporary file so a crash never leaves it truncated"""
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump({"structures": self.structures}, file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,121 @@
+#    Timing of the export stages and JSON-lines log of the exported structures
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+
+class StageTimer(object):
+    """Seconds spent in each named stage, accumulated over every `with timer.stage(name):`"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+def peak_rss_mb(children=False):
+    """Peak resident memory (MB) of this process, or of its finished children; None if unknown (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0)
+
+def export_record(entry):
+    """Log record of an export report entry (see brain_structures_export._export_job)"""
+    statistics = entry.get("statistics") or {}
+    bbox_size = None
+    if "bbox_lower" in statistics:
+        bbox_size = [upper - lower for lower, upper in zip(statistics["bbox_lower"], statistics["bbox_upper"])]
+    return {"id": entry["id"],
+            "name": entry["name"],
+            "status": entry["status"],
+            "worker": entry.get("worker"),
+            "seconds": entry.get("seconds"),
+            "timings": entry.get("timings", {}),
+            "voxel_count": statistics.get("voxel_count"),
+            "bbox_size": bbox_size,
+            "vertex_count": statistics.get("vertex_count"),
+            "face_count": statistics.get("face_count"),
+            "files": len(entry["files"]),
+            "error": entry["error"]}
+
+
+class ExportLog(object):
+    """JSON-lines file with one record per structure, written as soon as the structure is done
+
+    The file is appended to, so a resumed run keeps the timings of the structures it skips.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        self._file = open(path, 'a')
+
+    def write(self, entry):
+        record = export_record(entry)
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.records.append(record)
+
+    def close(self):
+        self._file.close()
+
+def read_log(path):
+    """Records of a JSON-lines export log"""
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def latest_records(records):
+    """Last record of every structure, the last timed one if the structure was exported before"""
+    latest = {}
+    for record in records:
+        previous = latest.get(record["id"])
+        if previous is None or record.get("seconds") is not None or previous.get("seconds") is None:
+            latest[record["id"]] = record
+    return list(latest.values())
+
+def summarize(records, count=10):
+    """Text report of the time spent per stage and of the slowest structures"""
+    timed_records = [record for record in records if record.get("seconds") is not None]
+    total = sum(record["seconds"] for record in timed_records)
+    stages = {}
+    for record in timed_records:
+        for stage, seconds in record["timings"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    lines = ["{} structures exported in {:.1f} s (summed over the workers)".format(len(timed_records), total)]
+    for stage, seconds in sorted(stages.items(), key=lambda item: -item[1]):
+        lines.append("  {:<12} {:10.1f} s  {:5.1f} %".format(stage, seconds, 100 * seconds / total if total else 0))
+    lines.append("Slowest structures:")
+    lines.append("  {:>8}  {:<12} {:>12} {:>10}  {}".format("seconds", "main stage", "voxels", "faces", "name"))
+    for record in sorted(timed_records, key=lambda record: -record["seconds"])[:count]:
+        main_stage = max(record["timings"].items(), key=lambda item: item[1])[0] if record["timings"] else "-"
+        lines.append("  {:8.2f}  {:<12} {:>12} {:>10}  {}".format(
+            record["seconds"], main_stage, record["voxel_count"] or 0, record["face_count"] or 0, record["name"]))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # python instrumentation.py OUTPUT_DIR/export_log.jsonl [count]
+    print(summarize(latest_records(read_log(sys.argv[1])), int(sys.argv[2]) if len(sys.argv) > 2 else 10))
@@ -0,0 +1,273 @@
+#    Single pass structure masks for the Allen annotation volume
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# The runs can be saved to a .npz store, so later runs skip the scan of the
+# annotation (see cached_label_index). The runs are split into chunks of
+# STORE_CHUNK_RUNS runs, each a compressed member of the .npz:
+#     starts_<n>: differences of consecutive run starts (the first one absolute)
+#     lengths_<n>: run lengths, in the smallest type holding a full row
+# next to the shape, the labels and their first run (label_ids, first_runs).
+
+import os
+import hashlib
+import numpy as np
+
+from sparse_mask import RunLengthMask
+
+SCAN_VOXELS = 2**24 # Annotation voxels scanned at once when building the index
+STORE_VERSION = 1
+STORE_CHUNK_RUNS = 2**20
+
+
+def descendant_closure(structure_graph):
+    """Map every structure id to the ids of itself and all its descendants"""
+    closure = {}
+    for struct in structure_graph:
+        for ancestor_id in struct["structure_id_path"]:
+            closure.setdefault(ancestor_id, []).append(struct["id"])
+    return closure
+
+def children_map(structure_graph):
+    """Map every structure id to the ids of its direct children"""
+    children = {struct["id"]: [] for struct in structure_graph}
+    for struct in structure_graph:
+        path = struct["structure_id_path"]
+        if len(path) > 1:
+            children.setdefault(path[-2], []).append(struct["id"])
+    return children
+
+
+class LabelIndex(object):
+    """Run-length encoded mask of every label of the annotation volume, built in a single scan
+
+    The annotation is read once: the non-zero voxels are grouped by label and
+    turned into runs along the last axis (see sparse_mask.RunLengthMask), so the
+    mask of any structure (the union of its descendant labels) can be rebuilt in
+    time proportional to its own size, instead of re-scanning the whole volume
+    like ReferenceSpace.make_structure_mask does.
+    """
+
+    def __init__(self, annotation, structure_graph, resolution=(10, 10, 10)):
+        self._set_structures(annotation.shape, structure_graph, resolution)
+
+        # Runs never cross rows, so they are found a slab of planes at a time: only one
+        # slab is dense, the rest of the memory is proportional to the number of runs
+        row_size = self.shape[2]
+        planes = max(1, SCAN_VOXELS // max(self.shape[1] * row_size, 1))
+        starts, stops, labels = [], [], []
+        for p0 in range(0, self.shape[0], planes):
+            slab = np.ascontiguousarray(annotation[p0:p0 + planes]).reshape(-1, row_size)
+            # A segment begins at each row start and at each change of label along the row
+            begins = np.ones(slab.shape, dtype=bool)
+            begins[:, 1:] = slab[:, 1:] != slab[:, :-1]
+            segment_starts = np.flatnonzero(begins)
+            del begins
+            segment_stops = np.append(segment_starts[1:], slab.size)
+            segment_labels = slab.ravel()[segment_starts]
+            del slab
+            annotated = segment_labels != 0
+            segment_starts, segment_stops = segment_starts[annotated], segment_stops[annotated]
+            # Run keys (see RunLengthMask), rows counted from the first plane of the volume
+            rows, columns = np.divmod(segment_starts, row_size)
+            keys = (rows + p0 * self.shape[1]) * (row_size + 1) + columns
+            starts.append(keys)
+            stops.append(keys + (segment_stops - segment_starts))
+            labels.append(segment_labels[annotated])
+            del segment_starts, segment_stops, segment_labels, rows, columns
+        run_labels = np.concatenate(labels) if labels else np.empty(0, dtype=annotation.dtype)
+        # The slabs come in key order, so a stable sort keeps each label's runs in order
+        order = np.argsort(run_labels, kind="stable")
+        self._starts = np.concatenate(starts)[order] if starts else np.empty(0, dtype=np.int64)
+        self._stops = np.concatenate(stops)[order] if stops else np.empty(0, dtype=np.int64)
+        run_labels = run_labels[order]
+        del starts, stops, labels, order
+
+        label_ids, first_runs = np.unique(run_labels, return_index=True)
+        del run_labels
+        self._index_labels(label_ids, first_runs)
+
+    def _set_structures(self, shape, structure_graph, resolution):
+        self.shape = tuple(shape)
+        self.resolution = tuple(resolution) # microns per voxel
+        self.descendants = descendant_closure(structure_graph)
+        self.children = children_map(structure_graph)
+        self.paths = {struct["id"]: struct["structure_id_path"] for struct in structure_graph}
+
+    def _index_labels(self, label_ids, first_runs):
+        """Run range, bounding box and size of each label, from the first run of each label"""
+        last_runs = np.append(first_runs[1:], len(self._starts))
+        self._ranges = {int(label): (first, last) for label, first, last in zip(label_ids, first_runs, last_runs)}
+        self._bounds = {}
+        self._counts = {}
+        if len(label_ids):
+            i, j, start, stop = RunLengthMask(self.shape, self._starts, self._stops)._rows()
+            lower = np.stack([np.minimum.reduceat(i, first_runs), np.minimum.reduceat(j, first_runs),
+                              np.minimum.reduceat(start, first_runs)], axis=1)
+            upper = np.stack([np.maximum.reduceat(i, first_runs), np.maximum.reduceat(j, first_runs),
+                              np.maximum.reduceat(stop, first_runs)], axis=1) + (1, 1, 0)
+            counts = np.add.reduceat(stop - start, first_runs)
+            for label, low, up, count in zip(label_ids, lower, upper, counts):
+                self._bounds[int(label)] = (low, up)
+                self._counts[int(label)] = int(count)
+        self._checksums = {}
+        self._volume_checksum = None
+
+    @classmethod
+    def load(cls, path, structure_graph, resolution=(10, 10, 10)):
+        """Label index saved by save(), read chunk by chunk"""
+        index = cls.__new__(cls)
+        with np.load(path) as store:
+            if int(store["version"]) != STORE_VERSION:
+                raise ValueError("Unsupported label index store version {} in {}".format(int(store["version"]), path))
+            index._set_structures(store["shape"], structure_graph, resolution)
+            index._starts = np.empty(int(store["n_runs"]), dtype=np.int64)
+            index._stops = np.empty_like(index._starts)
+            for chunk, start in enumerate(range(0, len(index._starts), STORE_CHUNK_RUNS)):
+                runs = slice(start, start + STORE_CHUNK_RUNS)
+                np.cumsum(store["starts_{}".format(chunk)], out=index._starts[runs])
+                index._stops[runs] = index._starts[runs] + store["lengths_{}".format(chunk)]
+            index._index_labels(store["label_ids"], store["first_runs"])
+        return index
+
+    def save(self, path):
+        """Write the runs to a compressed .npz store (see load)"""
+        label_ids = np.array(sorted(self._ranges), dtype=np.int64)
+        chunks = {}
+        length_dtype = np.min_scalar_type(self.shape[2])
+        for chunk, start in enumerate(range(0, len(self._starts), STORE_CHUNK_RUNS)):
+            starts = self._starts[start:start + STORE_CHUNK_RUNS]
+            # Sorted within a label, the differences are small and compress well
+            chunks["starts_{}".format(chunk)] = np.diff(starts, prepend=0)
+            chunks["lengths_{}".format(chunk)] = (self._stops[start:start + STORE_CHUNK_RUNS] - starts).astype(length_dtype)
+        # Through a temporary file, an interrupted save must not look complete
+        temporary_path = path + ".tmp.npz"
+        np.savez_compressed(temporary_path, version=STORE_VERSION, shape=np.array(self.shape), n_runs=len(self._starts),
+                            label_ids=label_ids,
+                            first_runs=np.array([self._ranges[label][0] for label in label_ids], dtype=np.int64),
+                            **chunks)
+        os.replace(temporary_path, path)
+
+    def labels(self, structure_id):
+        """Annotation labels present in the volume that make the structure"""
+        return [label for label in self.descendants.get(structure_id, [structure_id]) if label in self._ranges]
+
+    def voxel_count(self, structure_id):
+        """Number of voxels of the structure"""
+        return sum(self._counts[label] for label in self.labels(structure_id))
+
+    def checksum(self, structure_id):
+        """sha1 of the structure voxels, changes only if the annotation of the structure changes"""
+        sha = hashlib.sha1(str(self.shape).encode())
+        for label in self.labels(structure_id):
+            if label not in self._checksums:
+                runs = slice(*self._ranges[label])
+                self._checksums[label] = hashlib.sha1(self._starts[runs].tobytes() + self._stops[runs].tobytes()).hexdigest()
+            sha.update("{}:{};".format(label, self._checksums[label]).encode())
+        return sha.hexdigest()
+
+    def volume_checksum(self):
+        """sha1 of the voxels of every label, changes if any voxel of the annotation changes"""
+        if self._volume_checksum is None:
+            sha = hashlib.sha1(str(self.shape).encode())
+            for label in sorted(self._ranges):
+                sha.update("{}:{};".format(label, self._ranges[label]).encode())
+            sha.update(self._starts.tobytes())
+            sha.update(self._stops.tobytes())
+            self._volume_checksum = sha.hexdigest()
+        return self._volume_checksum
+
+    def bounding_box(self, structure_id):
+        """(lower, upper) voxel corners of the structure, upper excluded. None if the structure is empty"""
+        labels = self.labels(structure_id)
+        if not labels:
+            return None
+        lower = np.min([self._bounds[label][0] for label in labels], axis=0)
+        upper = np.max([self._bounds[label][1] for label in labels], axis=0)
+        return lower, upper
+
+    def label_mask(self, label):
+        """RunLengthMask of the voxels annotated with exactly this label"""
+        if label not in self._ranges:
+            return RunLengthMask.empty(self.shape)
+        runs = slice(*self._ranges[label])
+        return RunLengthMask(self.shape, self._starts[runs], self._stops[runs])
+
+    def structure_mask(self, structure_id):
+        """RunLengthMask of the structure, union of its descendant labels"""
+        return RunLengthMask.union_all(self.shape, [self.label_mask(label) for label in self.labels(structure_id)])
+
+    def voxels(self, structure_id):
+        """Flat indices (into the annotation volume) of the voxels of the structure"""
+        return self.structure_mask(structure_id).voxels()
+
+    def cropped_mask(self, structure_id, lower, upper):
+        """Boolean mask of the structure restricted to the box [lower, upper)"""
+        return self.structure_mask(structure_id).cropped(lower, upper)
+
+    def mask(self, structure_id):
+        """Boolean mask of the structure, same as ReferenceSpace.make_structure_mask([structure_id])"""
+        return self.structure_mask(structure_id).dense()
+
+    def slice_mask(self, structure_id, plane):
+        """Boolean (shape[1], shape[2]) mask of the structure on the plane of the first axis (coronal section)"""
+        masks = [self.label_mask(label).plane(plane) for label in self.labels(structure_id)]
+        return RunLengthMask.union_all(self.shape, masks).cropped((plane, 0, 0), (plane + 1,) + self.shape[1:])[0]
+
+    def bottom_up_masks(self, structure_ids):
+        """Yield (structure_id, RunLengthMask) for the given structures, children before their parent
+
+        Each mask is built as the union of its children's masks and of its own label,
+        the children's masks being dropped as soon as their parent is built, so only
+        the masks of the branch being walked are kept in memory.
+        """
+        wanted = set(structure_ids)
+        # Walk only the subtrees of the wanted structures that have no wanted ancestor
+        tops = [structure_id for structure_id in structure_ids
+                if not wanted.intersection(self.paths.get(structure_id, [structure_id])[:-1])]
+        for top in tops:
+            cache = {}
+            stack = [(top, False)]
+            while stack:
+                structure_id, expanded = stack.pop()
+                if not expanded:
+                    stack.append((structure_id, True))
+                    stack.extend((child, False) for child in self.children.get(structure_id, []))
+                    continue
+                parts = [cache.pop(child) for child in self.children.get(structure_id, [])]
+                parts.append(self.label_mask(structure_id))
+                mask = RunLengthMask.union_all(self.shape, parts)
+                if structure_id in wanted:
+                    yield structure_id, mask
+                cache[structure_id] = mask
+
+def annotation_checksum(annotation, planes=16):
+    """sha1 of the annotation shape, type and voxels, read a few planes at a time"""
+    sha = hashlib.sha1("{}{}".format(annotation.shape, annotation.dtype.str).encode())
+    for start in range(0, annotation.shape[0], planes):
+        sha.update(np.ascontiguousarray(annotation[start:start + planes]).tobytes())
+    return sha.hexdigest()
+
+def cached_label_index(annotation, structure_graph, resolution, directory):
+    """LabelIndex of the annotation, loaded from its store in directory if an earlier run saved it
+
+    The store is named by the annotation checksum, a changed annotation gets a new one.
+    """
+    path = os.path.join(directory, "label_index_{}.npz".format(annotation_checksum(annotation)))
+    if os.path.isfile(path):
+        return LabelIndex.load(path, structure_graph, resolution)
+    index = LabelIndex(annotation, structure_graph, resolution)
+    os.makedirs(directory, exist_ok=True)
+    index.save(path)
+    return index
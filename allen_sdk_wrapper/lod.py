@@ -0,0 +1,71 @@
+#    Coarser meshes of each structure, exported next to the full resolution one
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# A level is named by its voxel size in microns: "Name (ACR).lod50.obj" is
+# meshed from 50 um voxels. The full resolution mesh keeps its usual name.
+
+import os
+import re
+import json
+import numpy as np
+
+LOD_PATTERN = re.compile(r"\.lod(\d+)(\.\w+)$")
+
+
+def lod_factor(voxel_size, resolution):
+    """Integer downsampling factor from the annotation resolution to the voxel size (microns)"""
+    factors = {int(round(voxel_size / float(r))) for r in resolution}
+    if voxel_size <= 0 or len(factors) != 1 or any(voxel_size % r for r in resolution):
+        raise ValueError("LOD voxel size {} um is not a multiple of the resolution {}".format(voxel_size, resolution))
+    return factors.pop()
+
+def lod_path(path, voxel_size):
+    """Path of the level of detail of the mesh file"""
+    base, extension = os.path.splitext(path)
+    return "{}.lod{}{}".format(base, voxel_size, extension)
+
+def lod_voxel_size(path, resolution):
+    """Voxel size (microns) of the mesh file, the resolution for the full resolution mesh"""
+    match = LOD_PATTERN.search(path)
+    return int(match.group(1)) if match else int(resolution[0])
+
+def downsample_mask(mask, factor):
+    """Fraction of each factor^3 block of the mask that is inside the structure"""
+    if factor == 1:
+        return mask.astype(np.float32)
+    padded_shape = [-(-size // factor) * factor for size in mask.shape]
+    padded = np.zeros(padded_shape, dtype=np.float32)
+    padded[:mask.shape[0], :mask.shape[1], :mask.shape[2]] = mask
+    blocks = padded.reshape(padded_shape[0]//factor, factor, padded_shape[1]//factor, factor,
+                            padded_shape[2]//factor, factor)
+    return blocks.mean(axis=(1, 3, 5))
+
+def coarse_to_fine(verts, factor):
+    """Vertices from block coordinates back to voxel coordinates (block centers)"""
+    return verts * factor + (factor - 1) / 2.0
+
+def write_lod_index(report, resolution, path):
+    """JSON index of the levels available for each exported structure"""
+    index = {}
+    for entry in report:
+        levels = {}
+        for file in entry["files"]:
+            levels.setdefault(lod_voxel_size(file, resolution), []).append(file)
+        if levels:
+            index[str(entry["id"])] = {
+                "name": entry["name"],
+                "levels": [{"voxel_size": size, "files": levels[size]} for size in sorted(levels)]}
+    with open(path, 'w') as file:
+        json.dump(index, file, indent=1)
@@ -0,0 +1,191 @@
+#    Welding, simplification and smoothing of the exported meshes
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+
+
+def compact(verts, faces):
+    """Drop the degenerate and repeated faces, the pairs of back to back faces and the vertices no face uses"""
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+    # Same triangle with the same orientation: rotate so the smallest index is first
+    shift = np.argmin(faces, axis=1)
+    rotated = np.take_along_axis(faces, (shift[:, None] + np.arange(3)) % 3, axis=1)
+    rotated, first = np.unique(rotated, axis=0, return_index=True)
+    # A triangle and its reverse are a fin of no volume (clustering folds thin parts into them):
+    # both go, or their edges would have more than two faces
+    _, inverse, counts = np.unique(np.concatenate([rotated, rotated[:, [0, 2, 1]]]), axis=0,
+                                   return_inverse=True, return_counts=True)
+    fins = counts[inverse.reshape(-1)[:len(rotated)]] > 1
+    faces = faces[np.sort(first[~fins])]
+    used, faces = np.unique(faces, return_inverse=True)
+    return verts[used], faces.reshape(-1, 3)
+
+def weld_vertices(verts, faces, tolerance=0):
+    """Merge the vertices closer than tolerance (same grid cell of that size), exact duplicates with 0"""
+    keys = verts if tolerance <= 0 else np.floor(verts / tolerance)
+    unique_keys, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return compact(verts[first], inverse.reshape(-1)[faces])
+
+def boundary_vertices(faces, n_verts):
+    """Boolean array of the vertices on an open border (edges used by a single face)"""
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    boundary = np.zeros(n_verts, dtype=bool)
+    boundary[edges[counts == 1].ravel()] = True
+    return boundary
+
+def face_quadrics(verts, faces):
+    """Area weighted plane quadric (10 coefficients of the symmetric 4x4 matrix) of every face"""
+    normals = np.cross(verts[faces[:, 1]] - verts[faces[:, 0]], verts[faces[:, 2]] - verts[faces[:, 0]])
+    areas = np.linalg.norm(normals, axis=1)
+    normals = normals / np.maximum(areas, 1e-12)[:, None]
+    planes = np.hstack([normals, -np.sum(normals * verts[faces[:, 0]], axis=1)[:, None]])
+    rows, columns = np.triu_indices(4)
+    return planes[:, rows] * planes[:, columns] * (areas[:, None] / 2)
+
+def cluster(verts, faces, cell_size, boundary):
+    """Vertex clustering on a grid of the given cell size, one quadric-optimal vertex per cell
+
+    Lindstrom's out-of-core simplification: each cell's vertex minimises the sum of
+    the plane quadrics of the faces touching the cell, and stays inside the cell.
+    Cells holding open border vertices keep the mean of those, so a hemisphere cut
+    stays on its plane.
+    """
+    cells = np.floor(verts / cell_size).astype(np.int64)
+    unique_cells, cell_of_vertex = np.unique(cells, axis=0, return_inverse=True)
+    cell_of_vertex = cell_of_vertex.reshape(-1)
+    n_cells = len(unique_cells)
+
+    quadric_of_face = face_quadrics(verts, faces)
+    quadrics = np.zeros((n_cells, 10))
+    for corner in range(3):
+        for coefficient in range(10):
+            quadrics[:, coefficient] += np.bincount(cell_of_vertex[faces[:, corner]], quadric_of_face[:, coefficient], n_cells)
+
+    counts = np.bincount(cell_of_vertex, minlength=n_cells)
+    means = np.stack([np.bincount(cell_of_vertex, verts[:, axis], n_cells) for axis in range(3)], axis=1) / counts[:, None]
+
+    rows, columns = np.triu_indices(4)
+    matrices = np.zeros((n_cells, 4, 4))
+    matrices[:, rows, columns] = quadrics
+    matrices[:, columns, rows] = quadrics
+    a = matrices[:, :3, :3]
+    b = matrices[:, :3, 3]
+    # x = mean + pinv(A) (-b - A mean): the truncated pseudo-inverse keeps flat cells at their mean
+    residual = -b - np.einsum("nij,nj->ni", a, means)
+    positions = means + np.einsum("nij,nj->ni", np.linalg.pinv(a, rcond=1e-3), residual)
+    positions = np.clip(positions, unique_cells * cell_size, (unique_cells + 1) * cell_size)
+
+    if boundary.any():
+        boundary_counts = np.bincount(cell_of_vertex[boundary], minlength=n_cells)
+        on_border = boundary_counts > 0
+        boundary_sums = np.stack([np.bincount(cell_of_vertex[boundary], verts[boundary, axis], n_cells)
+                                  for axis in range(3)], axis=1)
+        positions[on_border] = boundary_sums[on_border] / boundary_counts[on_border, None]
+    return compact(positions.astype(verts.dtype), cell_of_vertex[faces])
+
+def decimate(verts, faces, target_faces=None, max_error=None):
+    """Simplify the mesh by quadric vertex clustering
+
+    max_error is the cell size (in voxels), which bounds how far a vertex moves.
+    With target_faces the cell size is searched so the face count gets just under the target.
+    The mesh stays closed and consistently oriented, but clustering is not topology preserving:
+    two sheets of the surface closer than a cell can be pinched together on an edge of four faces.
+    """
+    boundary = boundary_vertices(faces, len(verts))
+    if max_error:
+        return cluster(verts, faces, max_error, boundary)
+    if not target_faces or len(faces) <= target_faces:
+        return verts, faces
+    # The face count goes roughly with the inverse square of the cell size
+    edge_length = np.mean(np.linalg.norm(verts[faces[:, 1]] - verts[faces[:, 0]], axis=1))
+    low, high = 0.0, None
+    cell_size = edge_length * np.sqrt(len(faces) / float(target_faces))
+    best = None
+    for attempt in range(8):
+        simplified = cluster(verts, faces, cell_size, boundary)
+        if len(simplified[1]) <= target_faces:
+            best, high = simplified, cell_size
+        else:
+            low = cell_size
+        cell_size = (low + high) / 2 if high is not None else cell_size * 1.5
+    return best if best is not None else simplified
+
+def smooth(verts, faces, iterations=10, lamb=0.5, mu=-0.53):
+    """Taubin smoothing (Laplacian smoothing with mu=0), the open border vertices stay fixed"""
+    edges = np.unique(np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1), axis=0)
+    edges = np.vstack([edges, edges[:, ::-1]])
+    degrees = np.bincount(edges[:, 0], minlength=len(verts)).astype(verts.dtype)
+    movable = (~boundary_vertices(faces, len(verts)) & (degrees > 0))[:, None]
+    degrees = np.maximum(degrees, 1)[:, None]
+    verts = verts.copy()
+    for iteration in range(iterations):
+        for factor in ((lamb, mu) if mu else (lamb,)):
+            neighbours = np.stack([np.bincount(edges[:, 0], verts[edges[:, 1], axis], len(verts))
+                                   for axis in range(3)], axis=1)
+            verts += np.where(movable, factor * (neighbours / degrees - verts), 0).astype(verts.dtype)
+    return verts
+
+def mirror(verts, faces, plane, cut=None, axis=1):
+    """The mesh and its reflection about the plane verts[:, axis] == plane, welded along the plane
+
+    cut is where the mesh is left open, short of the plane (at the plane by default):
+    the open border on the cut is extruded to its reflection, which meshes the layer
+    between them once. The reflected faces are reversed to keep the outward orientation.
+    Faces lying in the plane would be inside the symmetric object and are dropped.
+    """
+    verts, faces = weld_vertices(verts, faces)
+    in_plane = verts[:, axis] == plane
+    faces = faces[~np.all(in_plane[faces], axis=1)]
+    n_verts = len(verts)
+    reflected = verts.copy()
+    reflected[:, axis] = 2 * plane - reflected[:, axis]
+    all_faces = [faces, faces[:, ::-1] + n_verts]
+    if cut is not None and cut != plane:
+        # Border edges a -> b: no face has b -> a. Each becomes the quad b, a, a', b' up to the reflection
+        edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        border = edges[~np.isin(edges[:, 1] * n_verts + edges[:, 0], edges[:, 0] * n_verts + edges[:, 1])]
+        a, b = border[np.all(verts[border, axis] == cut, axis=1)].T
+        all_faces += [np.stack([b, a, a + n_verts], axis=1), np.stack([b, a + n_verts, b + n_verts], axis=1)]
+    return weld_vertices(np.concatenate([verts, reflected]), np.concatenate(all_faces))
+
+def vertex_normals(verts, faces, normalize=True):
+    """Area weighted normals of the vertices, following the orientation of the faces
+
+    Duplicated vertices (the unwelded marching cubes output) get the same normal,
+    so the shading stays smooth across them. Without normalize, the sums of the
+    face normals (twice the areas), which add up across pieces of a mesh sharing vertices.
+    """
+    face_normals = np.cross(verts[faces[:, 1]] - verts[faces[:, 0]], verts[faces[:, 2]] - verts[faces[:, 0]])
+    positions, inverse = np.unique(np.round(verts, 4), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    normals = np.zeros((len(positions), 3))
+    for corner in range(3):
+        for axis in range(3):
+            normals[:, axis] += np.bincount(inverse[faces[:, corner]], face_normals[:, axis], len(positions))
+    normals = normals[inverse]
+    if normalize:
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    return normals
+
+def process_mesh(verts, faces, weld=False, target_faces=None, max_error=None, smooth_iterations=0):
+    """The export post-processing: welding, simplification then Taubin smoothing, each optional"""
+    if weld or target_faces or max_error:
+        verts, faces = weld_vertices(verts, faces)
+    if target_faces or max_error:
+        verts, faces = decimate(verts, faces, target_faces, max_error)
+    if smooth_iterations:
+        verts = smooth(verts, faces, smooth_iterations)
+    return verts, faces
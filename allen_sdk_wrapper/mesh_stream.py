@@ -0,0 +1,118 @@
+#    Meshes assembled on disk while they are extracted, brick by brick
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import tempfile
+import numpy as np
+
+from obj_writer import CHUNK_ROWS, write_obj_chunks
+from binary_mesh import write_mesh_chunks, BINARY_EXTENSION
+from mesh_processing import vertex_normals
+
+VERTEX_DTYPE = np.dtype("<f8") # As the vertices of the dense export, so the .obj text is the same
+FACE_DTYPE = np.dtype("<u4")
+
+
+class MeshSpool(object):
+    """Mesh whose vertices and faces are appended to temporary files as the bricks are meshed
+
+    Only the vertices on the faces shared between bricks are kept in memory, in a
+    map from their coordinates to their index, to weld the bricks together. The
+    mesh is then copied chunk by chunk to the .obj (and .bbm) files, so the memory
+    used stays near the size of one brick mesh.
+    With normals, the vertex normals are spooled too: a shared vertex gets the
+    faces of several bricks, its normal is completed in memory and patched at the end.
+    """
+
+    def __init__(self, directory=None, normals=False):
+        self._verts = tempfile.TemporaryFile(dir=directory)
+        self._faces = tempfile.TemporaryFile(dir=directory)
+        self._normals = tempfile.TemporaryFile(dir=directory) if normals else None
+        self._shared = {}
+        self._shared_normals = {}
+        self.n_verts = 0
+        self.n_faces = 0
+
+    def close(self):
+        self._verts.close()
+        self._faces.close()
+        if self._normals is not None:
+            self._normals.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def add(self, verts, faces, shared):
+        """Append a brick mesh, shared flagging the vertices that may already be in another brick"""
+        indices = np.empty(len(verts), dtype=np.int64)
+        new = np.ones(len(verts), dtype=bool)
+        shared_positions = np.flatnonzero(shared)
+        for position, key in zip(shared_positions, map(tuple, verts[shared_positions].tolist())):
+            index = self._shared.get(key)
+            if index is not None:
+                indices[position] = index
+                new[position] = False
+        n_new = int(np.count_nonzero(new))
+        indices[new] = np.arange(self.n_verts, self.n_verts + n_new)
+        for position in shared_positions[new[shared_positions]]:
+            self._shared[tuple(verts[position].tolist())] = int(indices[position])
+        self._verts.write(np.ascontiguousarray(verts[new], dtype=VERTEX_DTYPE).tobytes())
+        self._faces.write(np.ascontiguousarray(indices[faces], dtype=FACE_DTYPE).tobytes())
+        if self._normals is not None:
+            # Sums of the face normals, normalized when written out
+            normals = vertex_normals(verts, faces, normalize=False)
+            for position in shared_positions:
+                index = int(indices[position])
+                self._shared_normals[index] = self._shared_normals.get(index, 0) + normals[position]
+            self._normals.write(np.ascontiguousarray(normals[new], dtype=VERTEX_DTYPE).tobytes())
+        self.n_verts += n_new
+        self.n_faces += len(faces)
+
+    def _chunks(self, file, dtype, count):
+        """Arrays of at most CHUNK_ROWS rows of 3 values read back from the spool file"""
+        file.flush()
+        file.seek(0)
+        for start in range(0, count, CHUNK_ROWS):
+            rows = min(CHUNK_ROWS, count - start)
+            yield np.frombuffer(file.read(rows * 3 * dtype.itemsize), dtype=dtype).reshape(rows, 3)
+
+    def vertex_chunks(self):
+        return self._chunks(self._verts, VERTEX_DTYPE, self.n_verts)
+
+    def face_chunks(self):
+        return self._chunks(self._faces, FACE_DTYPE, self.n_faces)
+
+    def normal_chunks(self):
+        """Unit normals, once the normals of the shared vertices are complete. None without normals"""
+        if self._normals is None:
+            return None
+        for index, normal in self._shared_normals.items():
+            self._normals.seek(index * 3 * VERTEX_DTYPE.itemsize)
+            self._normals.write(np.asarray(normal, dtype=VERTEX_DTYPE).tobytes())
+        self._shared_normals = {}
+        return (normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+                for normals in self._chunks(self._normals, VERTEX_DTYPE, self.n_verts))
+
+    def write(self, obj_path, binary=False):
+        """Write the mesh as .obj (and .bbm with binary), returns the written files"""
+        written = [obj_path]
+        write_obj_chunks(obj_path, self.vertex_chunks(), self.face_chunks(), normal_chunks=self.normal_chunks())
+        if binary:
+            written.append(obj_path[:-4]+BINARY_EXTENSION)
+            write_mesh_chunks(written[-1], self.n_verts, self.n_faces, self.vertex_chunks(), self.face_chunks(),
+                              self.normal_chunks())
+        return written
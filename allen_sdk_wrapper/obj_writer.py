@@ -0,0 +1,69 @@
+#    Bulk Wavefront .obj writing for the brain structures export
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+
+CHUNK_ROWS = 65536 # Number of "v" or "f" lines formatted and written at once
+NORMAL_PRECISION = 4 # Decimals of the "vn" coordinates
+
+
+def format_values(values, precision=None):
+    """Text of every value of the array, as a flat list of strings
+
+    precision=None gives str() of each element (the shortest repr, as the old
+    per-vertex loop wrote), otherwise the number of decimals. Marching cubes
+    coordinates take few distinct values, so only the unique ones are formatted.
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    if precision is None:
+        texts = unique.astype(str).astype(object)
+    else:
+        fmt = "%.{}f".format(precision)
+        texts = np.array([fmt % value for value in unique.tolist()], dtype=object)
+    return texts[inverse.ravel()].tolist()
+
+def write_obj(path, verts, faces, precision=None, normals=None):
+    """Write the mesh as "v x y z" lines then "f a b c" lines (1-based), same layout as the old export loop
+
+    With normals (one per vertex), "vn x y z" lines follow the vertices and the
+    faces become "f a//a b//b c//c".
+    """
+    write_obj_chunks(path, [verts], [faces], precision, None if normals is None else [normals])
+
+def write_obj_chunks(path, vert_chunks, face_chunks, precision=None, normal_chunks=None):
+    """Same as write_obj for a mesh given as consecutive chunks of vertices, faces (global indices) and normals"""
+    with open(path, 'w') as file:
+        for verts in vert_chunks:
+            verts = np.asarray(verts)
+            vert_texts = format_values(verts, precision)
+            for start in range(0, len(verts), CHUNK_ROWS):
+                rows = min(CHUNK_ROWS, len(verts) - start)
+                file.write(("v %s %s %s\n" * rows) % tuple(vert_texts[3*start:3*(start+rows)]))
+        face_line = "f %d %d %d\n"
+        if normal_chunks is not None:
+            for normals in normal_chunks:
+                normals = np.asarray(normals)
+                normal_texts = format_values(normals, NORMAL_PRECISION)
+                for start in range(0, len(normals), CHUNK_ROWS):
+                    rows = min(CHUNK_ROWS, len(normals) - start)
+                    file.write(("vn %s %s %s\n" * rows) % tuple(normal_texts[3*start:3*(start+rows)]))
+            face_line = "f %d//%d %d//%d %d//%d\n"
+        for faces in face_chunks:
+            faces = np.asarray(faces)
+            for start in range(0, len(faces), CHUNK_ROWS):
+                chunk = faces[start:start+CHUNK_ROWS] + 1
+                if normal_chunks is not None:
+                    chunk = np.repeat(chunk, 2, axis=1) # The normal of a vertex has the vertex index
+                file.write((face_line * len(chunk)) % tuple(chunk.ravel().tolist()))
@@ -0,0 +1,102 @@
+#    Coarser annotation volumes derived from the loaded one, by majority label
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# A coarse voxel gets the most frequent label of the fine voxels whose center
+# falls in it, so the voxel sizes need not be multiples (10 um to 25 um takes
+# blocks of 2 or 3 voxels along each axis). Ties go to the smallest structure id;
+# the background (0) only wins with more voxels than any structure, so the
+# structures do not shrink at the surface of the brain.
+
+import os
+import numpy as np
+
+SLAB_VOXELS = 2**24 # Fine voxels resampled at once
+
+
+def coarse_indices(size, source_size, target_size):
+    """Coarse voxel of each of the size fine voxels along one axis (integer voxel sizes in microns)"""
+    return (2 * np.arange(size, dtype=np.int64) + 1) * source_size // (2 * target_size)
+
+def resampled_shape(shape, source_resolution, resolution):
+    return tuple(int(coarse_indices(size, source, target)[-1]) + 1
+                 for size, source, target in zip(shape, source_resolution, resolution))
+
+def mode_labels(cells, labels):
+    """Most frequent label of every cell, given the cell and label of each fine voxel, by increasing cell"""
+    # Sorting the (cell, label) keys groups the voxels of a cell by label; the labels fit in 32 bits
+    keys = np.sort((cells.astype(np.int64) << 32) | labels.astype(np.int64))
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    keys = keys[starts]
+    cells, labels = keys >> 32, keys & 0xFFFFFFFF
+    # Twice the count, less one for the background: background ties are lost
+    scores = 2 * counts - (labels == 0)
+    cell_starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    best = np.maximum.reduceat(scores, cell_starts)
+    # The first of the best scores of each cell is the smallest label among them
+    winners = np.flatnonzero(scores == np.repeat(best, np.diff(np.r_[cell_starts, len(cells)])))
+    winners = winners[np.r_[True, cells[winners[1:]] != cells[winners[:-1]]]]
+    return labels[winners]
+
+def resample_annotation(annotation, source_resolution, resolution, slab_voxels=SLAB_VOXELS):
+    """Annotation at the coarser resolution (microns per axis), blockwise by slabs of the first axis
+
+    Only a slab of about slab_voxels fine voxels is in memory at a time, the
+    annotation can be memory-mapped.
+    """
+    if any(target < source for source, target in zip(source_resolution, resolution)):
+        raise ValueError("Resampling from {} um to {} um would upsample".format(source_resolution, resolution))
+    shape = resampled_shape(annotation.shape, source_resolution, resolution)
+    indices = [coarse_indices(size, source, target)
+               for size, source, target in zip(annotation.shape, source_resolution, resolution)]
+    firsts = [np.searchsorted(index, np.arange(size)) for index, size in zip(indices, shape)]
+    resampled = np.zeros(shape, dtype=annotation.dtype)
+    plane_cells = shape[1] * shape[2]
+    # In plane, the cell of every fine voxel, the same for all the planes
+    in_plane = (indices[1][:, None] * shape[2] + indices[2][None, :]).ravel()
+    fine_per_plane = -(-annotation.shape[0] // shape[0]) * annotation.shape[1] * annotation.shape[2]
+    planes = max(1, slab_voxels // fine_per_plane)
+    for c0 in range(0, shape[0], planes):
+        c1 = min(c0 + planes, shape[0])
+        f0, f1 = np.searchsorted(indices[0], [c0, c1])
+        slab = np.asarray(annotation[f0:f1])
+        # Most cells are inside a structure or outside the brain: a cell whose voxels all
+        # have the label of its first voxel is done without sorting
+        modes = slab[np.ix_(firsts[0][c0:c1] - f0, firsts[1], firsts[2])].ravel()
+        labels = slab.ravel()
+        cells = ((indices[0][f0:f1, None] - c0) * plane_cells + in_plane[None, :]).ravel()
+        mixed = np.bincount(cells, weights=labels != modes[cells], minlength=len(modes)) > 0
+        if mixed.any():
+            inside = mixed[cells]
+            modes[mixed] = mode_labels(cells[inside], labels[inside])
+            del inside
+        resampled[c0:c1] = modes.reshape(c1 - c0, *shape[1:])
+        del slab, labels, cells
+    return resampled
+
+def load_resampled(source, source_path, path, source_resolution, resolution):
+    """Resampled annotation, memory-mapped from its .npy cache at path
+
+    source is the annotation loaded from source_path; the cache is computed
+    once, and again if the source file is newer.
+    """
+    if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(source_path):
+        resampled = resample_annotation(source, source_resolution, resolution)
+        # Through a temporary file, an interrupted resampling must not look complete
+        temporary_path = path + ".tmp.npy"
+        np.save(temporary_path, resampled)
+        os.replace(temporary_path, path)
+        del resampled
+    return np.load(path, mmap_mode='r')
@@ -0,0 +1,181 @@
+#    Run-length encoded structure masks
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+
+
+def _merge(starts, stops):
+    """Sorted, disjoint and non-adjacent runs covering the same positions as the given ones"""
+    if not len(starts):
+        return starts, stops
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    reach = np.maximum.accumulate(stops[order])
+    # A run begins where it does not overlap nor touch everything before it
+    begins = np.ones(len(starts), dtype=bool)
+    begins[1:] = starts[1:] > reach[:-1]
+    ends = np.append(np.flatnonzero(begins)[1:] - 1, len(starts) - 1)
+    return starts[begins], reach[ends]
+
+
+class RunLengthMask(object):
+    """Boolean mask of a 3D volume stored as runs of voxels along the last axis
+
+    A run covers voxels [start, stop) of the row (i, j), positions being encoded
+    as key = (i * shape[1] + j) * (shape[2] + 1) + k, so runs never cross rows.
+    The runs are kept sorted, disjoint and non-adjacent. Densification only
+    happens in cropped(), on the box being meshed.
+    """
+
+    def __init__(self, shape, starts, stops):
+        self.shape = tuple(shape)
+        self.starts = starts
+        self.stops = stops
+
+    @classmethod
+    def empty(cls, shape):
+        return cls(shape, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def from_voxels(cls, shape, voxels):
+        """Mask of the voxels given as flat indices of the volume"""
+        voxels = np.asarray(voxels, dtype=np.int64)
+        rows, columns = np.divmod(voxels, shape[2])
+        keys = rows * (shape[2] + 1) + columns
+        return cls(shape, *_merge(keys, keys + 1))
+
+    @classmethod
+    def from_dense(cls, mask, lower=(0, 0, 0), shape=None):
+        """Mask of the dense boolean sub-volume placed at lower in a volume of the given shape"""
+        lower = np.asarray(lower)
+        shape = tuple(shape or mask.shape)
+        i, j, k = np.nonzero(mask)
+        voxels = np.ravel_multi_index((i + lower[0], j + lower[1], k + lower[2]), shape)
+        return cls.from_voxels(shape, voxels)
+
+    @classmethod
+    def union_all(cls, shape, masks):
+        """Union of any number of masks"""
+        masks = [mask for mask in masks if len(mask.starts)]
+        if not masks:
+            return cls.empty(shape)
+        if len(masks) == 1:
+            return masks[0]
+        return cls(shape, *_merge(np.concatenate([mask.starts for mask in masks]),
+                                  np.concatenate([mask.stops for mask in masks])))
+
+    def _combine(self, other, operation):
+        """Mask of the positions where operation(inside self, inside other) holds"""
+        keys = np.concatenate([self.starts, self.stops, other.starts, other.stops])
+        n_self = 2 * len(self.starts)
+        delta_self = np.zeros(len(keys), dtype=np.int64)
+        delta_self[:len(self.starts)] = 1
+        delta_self[len(self.starts):n_self] = -1
+        delta_other = np.zeros(len(keys), dtype=np.int64)
+        delta_other[n_self:n_self + len(other.starts)] = 1
+        delta_other[n_self + len(other.starts):] = -1
+        if not len(keys):
+            return RunLengthMask.empty(self.shape)
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        unique_keys, first = np.unique(keys, return_index=True)
+        inside_self = np.cumsum(np.add.reduceat(delta_self[order], first)) > 0
+        inside_other = np.cumsum(np.add.reduceat(delta_other[order], first)) > 0
+        # Between a key and the next one the state does not change
+        inside = operation(inside_self, inside_other)[:-1]
+        return RunLengthMask(self.shape, *_merge(unique_keys[:-1][inside], unique_keys[1:][inside]))
+
+    def union(self, other):
+        return RunLengthMask.union_all(self.shape, [self, other])
+
+    def intersection(self, other):
+        return self._combine(other, np.logical_and)
+
+    def difference(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __len__(self):
+        """Number of voxels in the mask"""
+        return int(np.sum(self.stops - self.starts))
+
+    def nbytes(self):
+        return self.starts.nbytes + self.stops.nbytes
+
+    def _rows(self):
+        """(i, j, start k, stop k) of every run"""
+        rows, start_columns = np.divmod(self.starts, self.shape[2] + 1)
+        i, j = np.divmod(rows, self.shape[1])
+        return i, j, start_columns, start_columns + (self.stops - self.starts)
+
+    def bounding_box(self):
+        """(lower, upper) voxel corners, upper excluded. None if the mask is empty"""
+        if not len(self.starts):
+            return None
+        i, j, start, stop = self._rows()
+        return np.array([i.min(), j.min(), start.min()]), np.array([i.max() + 1, j.max() + 1, stop.max()])
+
+    def centroid(self):
+        """Mean voxel coordinates (i, j, k) of the mask. None if the mask is empty"""
+        if not len(self.starts):
+            return None
+        i, j, start, stop = self._rows()
+        lengths = stop - start
+        # Sum of k over a run [start, stop) is (start + stop - 1) * length / 2
+        sums = [np.sum(i * lengths), np.sum(j * lengths), np.sum((start + stop - 1) * lengths) / 2.0]
+        return np.array(sums, dtype=np.float64) / np.sum(lengths)
+
+    def voxels(self):
+        """Flat indices of the voxels of the mask"""
+        i, j, start, stop = self._rows()
+        lengths = stop - start
+        run_of_voxel = np.repeat(np.arange(len(lengths)), lengths)
+        offsets = np.arange(len(run_of_voxel)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return (i[run_of_voxel] * self.shape[1] + j[run_of_voxel]) * self.shape[2] + start[run_of_voxel] + offsets
+
+    def clipped(self, lower, upper):
+        """Mask of the voxels inside the box [lower, upper), still run-length encoded"""
+        i, j, start, stop = self._rows()
+        start = np.maximum(start, lower[2])
+        stop = np.minimum(stop, upper[2])
+        keep = (i >= lower[0]) & (i < upper[0]) & (j >= lower[1]) & (j < upper[1]) & (start < stop)
+        rows = (i[keep] * self.shape[1] + j[keep]) * (self.shape[2] + 1)
+        return RunLengthMask(self.shape, rows + start[keep], rows + stop[keep])
+
+    def plane(self, i):
+        """Mask of the voxels of the plane i of the first axis, its runs being contiguous"""
+        plane_keys = self.shape[1] * (self.shape[2] + 1)
+        first, last = np.searchsorted(self.starts, [i * plane_keys, (i + 1) * plane_keys])
+        return RunLengthMask(self.shape, self.starts[first:last], self.stops[first:last])
+
+    def cropped(self, lower, upper):
+        """Dense boolean mask restricted to the box [lower, upper)"""
+        lower = np.asarray(lower)
+        upper = np.asarray(upper)
+        size = upper - lower
+        i, j, start, stop = self._rows()
+        start = np.maximum(start, lower[2]) - lower[2]
+        stop = np.minimum(stop, upper[2]) - lower[2]
+        keep = (i >= lower[0]) & (i < upper[0]) & (j >= lower[1]) & (j < upper[1]) & (start < stop)
+        rows = (i[keep] - lower[0]) * size[1] + (j[keep] - lower[1])
+        # +1 where a run starts and -1 where it stops, the running sum along the rows is the mask
+        edges = np.zeros((size[0] * size[1], size[2] + 1), dtype=np.int8)
+        np.add.at(edges, (rows, start[keep]), 1)
+        np.add.at(edges, (rows, stop[keep]), -1)
+        return (np.cumsum(edges[:, :-1], axis=1, dtype=np.int8) > 0).reshape(tuple(size))
+
+    def dense(self):
+        """Dense boolean mask of the whole volume"""
+        return self.cropped((0, 0, 0), self.shape)
@@ -0,0 +1,48 @@
+#    Names and output paths of all the structures, computed once from the structure graph
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import json
+
+
+def sanitize(name):
+    """Name usable as a file or folder name"""
+    return name.replace("/","-")
+
+def build_structure_index(structure_graph):
+    """Map every structure id to its acronym, file name, parent id and directory
+
+    The file name is "Name (ACR)" and the directory the list of the ancestors'
+    acronyms, root first, both sanitized: the layout the tree importer reads.
+    """
+    acronyms = {struct["id"]: sanitize(struct["acronym"]) for struct in structure_graph}
+    index = {}
+    for struct in structure_graph:
+        path = struct["structure_id_path"]
+        index[struct["id"]] = {
+            "acronym": acronyms[struct["id"]],
+            "name": sanitize(struct["name"] + " (" + struct["acronym"] + ")"),
+            "parent_id": path[-2] if len(path) > 1 else None,
+            "directory": [acronyms[parent_id] for parent_id in path[:-1]]}
+    return index
+
+def structure_directory(index, structure_id, root_path):
+    """Output directory of the structure under root_path, ending with a separator"""
+    return os.path.join(root_path, *index[structure_id]["directory"]) + os.sep
+
+def write_structure_index(index, path):
+    """Save the index as JSON (ids become strings) for the tools working on the exported tree"""
+    with open(path, 'w') as file:
+        json.dump({str(structure_id): entry for structure_id, entry in index.items()}, file, indent=1)
@@ -0,0 +1,59 @@
+#    Size, position and surface of the exported structures, gathered in one table
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# Positions are in voxel coordinates of the reoriented annotation (AP, ML, DV),
+# the coordinates of the exported mesh vertices. Volumes and areas are in mm.
+
+import numpy as np
+
+
+def mask_statistics(mask, resolution):
+    """Voxel count, volume (mm3), centroid and bounding box of the structure RunLengthMask"""
+    box = mask.bounding_box()
+    if box is None:
+        return {"voxel_count": 0, "volume_mm3": 0.0}
+    count = len(mask)
+    return {"voxel_count": count,
+            "volume_mm3": count * float(np.prod(resolution)) * 1e-9,
+            "centroid": mask.centroid().tolist(),
+            "bbox_lower": box[0].tolist(),
+            "bbox_upper": box[1].tolist()}
+
+def surface_area(verts, faces, resolution):
+    """Area (mm2) of the mesh given in voxel coordinates"""
+    verts = np.asarray(verts, dtype=np.float64) * (np.asarray(resolution) * 1e-3)
+    normals = np.cross(verts[faces[:, 1]] - verts[faces[:, 0]], verts[faces[:, 2]] - verts[faces[:, 0]])
+    return float(np.sum(np.linalg.norm(normals, axis=1)) / 2)
+
+def write_statistics(report, path):
+    """Save the statistics of the report entries as one .npz column per statistic
+
+    Vectors are (n, 3) columns. Missing values (no voxel, no surface) are NaN, 0 for the counts.
+    """
+    entries = [entry for entry in report if entry.get("statistics")]
+    def column(name, size=None):
+        missing = np.nan if size is None else [np.nan] * size
+        return np.array([entry["statistics"].get(name, missing) for entry in entries], dtype=np.float64)
+    np.savez(path,
+             id=np.array([entry["id"] for entry in entries], dtype=np.int64),
+             name=np.array([entry["name"] for entry in entries], dtype=str),
+             voxel_count=np.array([entry["statistics"]["voxel_count"] for entry in entries], dtype=np.int64),
+             vertex_count=np.array([entry["statistics"].get("vertex_count", 0) for entry in entries], dtype=np.int64),
+             face_count=np.array([entry["statistics"].get("face_count", 0) for entry in entries], dtype=np.int64),
+             volume_mm3=column("volume_mm3"),
+             surface_area_mm2=column("surface_area_mm2"),
+             centroid=column("centroid", 3).reshape(-1, 3),
+             bbox_lower=column("bbox_lower", 3).reshape(-1, 3),
+             bbox_upper=column("bbox_upper", 3).reshape(-1, 3))
@@ -0,0 +1,174 @@
+#    Meshes of all the structures from a single sweep of the annotation volume
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+# Multi-label surface nets: a cell is the cube between 8 neighbouring voxel
+# centers, and every cell whose corners do not all have the same label gets one
+# vertex, at the mean of the midpoints of its edges joining different labels.
+# Every pair of neighbouring voxels with different labels gives a quad made of
+# the vertices of the 4 cells around their edge. The vertices are shared by all
+# the labels around them, so adjacent structures get exactly the same interface.
+
+import numpy as np
+
+# Corner offsets of a cell, and its 12 edges as pairs of corners
+CORNERS = np.array([(i, j, k) for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+EDGES = [(a, b) for a in range(8) for b in range(a + 1, 8) if np.abs(CORNERS[a] - CORNERS[b]).sum() == 1]
+EDGE_MIDPOINTS = np.array([(CORNERS[a] + CORNERS[b]) / 2.0 for a, b in EDGES])
+# Cells around an edge along axis a, as offsets along the two other axes (a+1, a+2),
+# in the order giving a quad oriented along +a
+QUAD_OFFSETS = [(-1, -1), (0, -1), (0, 0), (-1, 0)]
+
+
+class SurfaceNet(object):
+    """Interfaces between all the labels of the annotation, computed slab by slab along the first axis
+
+    ml_range is the (start, stop) range kept along the medio-lateral axis (see
+    brain_structures_export.hemisphere_range). A hemisphere cut is left open, on
+    the plane halfway between the last kept column and the next one (cut_plane).
+    Only one slab of slab_size planes is dense at a time.
+    """
+
+    def __init__(self, annotation, ml_range=None, slab_size=32):
+        self.shape = annotation.shape
+        start, stop = ml_range or (0, self.shape[1])
+        self.ml_range = (start, stop)
+        self.cut_plane = stop - 0.5 if stop < self.shape[1] else (start - 0.5 if start > 0 else None)
+        self._annotation = annotation
+        # Padded volume: one plane of label 0 on every side, so the surfaces are closed,
+        # except at a hemisphere cut where the last column is repeated, which leaves the
+        # surface open on the cut plane
+        self._open = (start > 0, stop < self.shape[1])
+        self._padded_shape = (self.shape[0] + 2, stop - start + 2, self.shape[2] + 2)
+
+        cell_ids, positions, pairs, quads = [], [], [], []
+        n_cell_planes = self._padded_shape[0] - 1
+        for c0 in range(0, n_cell_planes, slab_size):
+            c1 = min(c0 + slab_size, n_cell_planes)
+            slab = self._padded_slab(c0, c1 + 1)
+            ids, slab_positions = self._vertices(slab, c0)
+            cell_ids.append(ids)
+            positions.append(slab_positions)
+            slab_pairs, slab_quads = self._quads(slab, c0)
+            pairs.append(slab_pairs)
+            quads.append(slab_quads)
+            del slab
+        # The slabs come in order and the cells in each slab in increasing order
+        self.cell_ids = np.concatenate(cell_ids)
+        self.positions = np.concatenate(positions)
+        self.pairs = np.concatenate(pairs)
+        quads = np.concatenate(quads)
+        index_dtype = np.int32 if len(self.cell_ids) < 2**31 else np.int64
+        self.quads = np.searchsorted(self.cell_ids, quads).astype(index_dtype)
+        del quads
+
+        # Quads of each label, on either side
+        self._sides = []
+        for side in (0, 1):
+            order = np.argsort(self.pairs[:, side], kind="stable")
+            labels, first = np.unique(self.pairs[order, side], return_index=True)
+            last = np.append(first[1:], len(order))
+            self._sides.append((order, {int(label): (f, l) for label, f, l in zip(labels, first, last)}))
+
+    def _padded_slab(self, p0, p1):
+        """Planes [p0, p1) of the padded volume"""
+        start, stop = self.ml_range
+        slab = np.zeros((p1 - p0,) + self._padded_shape[1:], dtype=self._annotation.dtype)
+        a0, a1 = max(p0 - 1, 0), min(p1 - 1, self.shape[0])
+        if a0 < a1:
+            slab[a0 + 1 - p0:a1 + 1 - p0, 1:-1, 1:-1] = self._annotation[a0:a1, start:stop, :]
+            if self._open[0]:
+                slab[:, 0, :] = slab[:, 1, :]
+            if self._open[1]:
+                slab[:, -1, :] = slab[:, -2, :]
+        return slab
+
+    def _cell_id(self, i, j, k):
+        return (i * (self._padded_shape[1] - 1) + j) * (self._padded_shape[2] - 1) + k
+
+    def _vertices(self, slab, c0):
+        """(cell ids, vertex positions in volume coordinates) of the active cells of the slab"""
+        n, nj, nk = slab.shape[0] - 1, slab.shape[1] - 1, slab.shape[2] - 1
+        corners = [slab[di:di+n, dj:dj+nj, dk:dk+nk] for di, dj, dk in CORNERS]
+        active = np.zeros((n, nj, nk), dtype=bool)
+        for corner in corners[1:]:
+            active |= corner != corners[0]
+        i, j, k = np.nonzero(active)
+        del active
+        labels = np.stack([corner[i, j, k] for corner in corners], axis=1)
+        different = np.stack([labels[:, a] != labels[:, b] for a, b in EDGES], axis=1).astype(np.float64)
+        offsets = different.dot(EDGE_MIDPOINTS) / different.sum(axis=1)[:, None]
+        start = self.ml_range[0]
+        positions = np.stack([i + c0 - 1, j + start - 1, k - 1], axis=1) + offsets
+        return self._cell_id(i + c0, j, k), positions
+
+    def _quads(self, slab, c0):
+        """(label pairs, quads of cell ids) of the edges between different labels owned by the slab
+
+        The slab owns the edges starting on its planes but the last, which is the first of the next slab.
+        A pair (a, b) has its quad oriented from the voxel labelled a to the one labelled b.
+        """
+        all_pairs, all_quads = [], []
+        cell_shape = np.array(self._padded_shape) - 1
+        for axis in range(3):
+            size = list(slab.shape)
+            size[0] -= 1 # The last plane belongs to the next slab
+            if axis != 0:
+                size[axis] -= 1
+            lower = slab[:size[0], :size[1], :size[2]]
+            shift = [0, 0, 0]
+            shift[axis] = 1
+            upper = slab[shift[0]:shift[0]+size[0], shift[1]:shift[1]+size[1], shift[2]:shift[2]+size[2]]
+            i, j, k = np.nonzero(lower != upper)
+            pairs = np.stack([lower[i, j, k], upper[i, j, k]], axis=1)
+            voxel = np.stack([i + c0, j, k], axis=1)
+            u, v = (axis + 1) % 3, (axis + 2) % 3
+            cells = []
+            valid = np.ones(len(voxel), dtype=bool)
+            for du, dv in QUAD_OFFSETS:
+                cell = voxel.copy()
+                cell[:, u] += du
+                cell[:, v] += dv
+                valid &= np.all((cell >= 0) & (cell < cell_shape), axis=1)
+                cells.append(cell)
+            # Edges of the padding at a hemisphere cut miss cells: the surface stays open there
+            quads = np.stack([self._cell_id(cell[valid, 0], cell[valid, 1], cell[valid, 2]) for cell in cells], axis=1)
+            all_pairs.append(pairs[valid])
+            all_quads.append(quads)
+        return np.concatenate(all_pairs), np.concatenate(all_quads)
+
+    def _label_quads(self, labels, side):
+        """Indices of the quads having one of the labels on the given side (0 or 1)"""
+        order, ranges = self._sides[side]
+        parts = [order[slice(*ranges[label])] for label in labels if label in ranges]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def structure_mesh(self, labels):
+        """(verts, faces) of the surface of the union of the labels, None if it has none
+
+        The quads between two labels both in the union are inside it and left out.
+        """
+        labels = np.asarray(list(labels), dtype=self.pairs.dtype)
+        outward = self._label_quads(labels, 0)
+        outward = outward[~np.isin(self.pairs[outward, 1], labels)]
+        inward = self._label_quads(labels, 1)
+        inward = inward[~np.isin(self.pairs[inward, 0], labels)]
+        if not len(outward) and not len(inward):
+            return None
+        # Every quad is split along the same diagonal whatever the side, so the structures on
+        # both sides get the same triangles (quads are not planar); the inward ones are flipped after
+        split = lambda quads: np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+        triangles = np.concatenate([split(self.quads[outward]), split(self.quads[inward])[:, ::-1]])
+        used, faces = np.unique(triangles, return_inverse=True)
+        return self.positions[used], faces.reshape(-1, 3)
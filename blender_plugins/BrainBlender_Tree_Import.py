@@ -21,7 +21,7 @@ bl_info = {
     "version": (0, 1, 0),
     "blender": (2, 7, 0),
     "location": "Scene > Wavefront (.obj) tree Import",
-    "description": "Imports .obj files organized in a tree in batch, with option of applying a Remesh modifier",
+    "description": "Imports .obj (or binary .bbm) files organized in a tree, or an atlas archive (.bba), in batch, with option of applying a Remesh modifier",
     "warning": "",
     "wiki_url": "",
     "tracker_url": "",
@@ -29,12 +29,16 @@ bl_info = {
 
 import bpy
 import os
+import re
+import json
+import struct
+import numpy as np  # must have Blender > 2.7
 
 # Define import properties
 bpy.types.Scene.bb_remesh_when_importing = bpy.props.BoolProperty \
     (
     name = "Use Remesh",
-    description = "Add 'Remesh' modifier to imported meshes in smooth mode",
+    description = "Add 'Remesh' modifier to imported meshes in smooth mode, except those exported with normals",
     default = True
     )
 bpy.types.Scene.bb_apply_remesh = bpy.props.BoolProperty \
@@ -69,6 +73,31 @@ bpy.types.Scene.bb_pix_scale = bpy.props.FloatProperty \
     min = 1e-100,
     precision=4
     )
+bpy.types.Scene.bb_use_binary_meshes = bpy.props.BoolProperty \
+    (
+    name = "Use Binary Meshes",
+    description = "Load the binary mesh (.bbm) exported next to a .obj instead of parsing the .obj",
+    default = True
+    )
+bpy.types.Scene.bb_mirror_hemisphere = bpy.props.BoolProperty \
+    (
+    name = "Mirror Hemisphere",
+    description = "Add a Mirror modifier completing the one hemisphere meshes (off for meshes exported with both hemispheres or mirrored)",
+    default = True
+    )
+bpy.types.Scene.bb_lod_voxel_size = bpy.props.IntProperty \
+    (
+    name = "Level of Detail (microns)",
+    description = "Load the coarser mesh exported with this voxel size when available (0 for full resolution)",
+    default = 0,
+    min = 0
+    )
+bpy.types.Scene.bb_atlas_root = bpy.props.StringProperty \
+    (
+    name = "Atlas Root",
+    description = "Acronym of the structure imported from an atlas archive (empty for the top of the archive)",
+    default = ""
+    )
 bpy.types.Scene.bb_tree_depth = bpy.props.IntProperty \
     (
     name = "Tree depth",
@@ -101,6 +130,10 @@ class wavefrontPanel(bpy.types.Panel):
 
         row = self.layout.row()
         row.prop(context.scene , "bb_use_smooth_shade")
+        row.prop(context.scene , "bb_use_binary_meshes")
+
+        row = self.layout.row()
+        row.prop(context.scene , "bb_mirror_hemisphere")
 
         row = self.layout.row()
         row.prop(context.scene , "bb_remesh_octree_depth")
@@ -108,6 +141,9 @@ class wavefrontPanel(bpy.types.Panel):
         row = self.layout.row()
         row.prop(context.scene , "bb_pix_scale")
 
+        row = self.layout.row()
+        row.prop(context.scene , "bb_lod_voxel_size")
+
         row = self.layout.row()
         row.prop(context.scene , "bb_tree_depth")
         row.prop(context.scene , "bb_import_parents")
@@ -115,6 +151,10 @@ class wavefrontPanel(bpy.types.Panel):
         row = self.layout.row()
         row.operator("bb_tree_import.obj", text='Import Object(s)', icon='MESH_ICOSPHERE')
 
+        row = self.layout.row()
+        row.prop(context.scene , "bb_atlas_root")
+        row.operator("bb_tree_import.atlas", text='Import Atlas Archive', icon='FILE')
+
 
 class importButton(bpy.types.Operator):
     """Objects will be resized by the scale provided"""
@@ -135,8 +175,106 @@ class importButton(bpy.types.Operator):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
+class importAtlasButton(bpy.types.Operator):
+    """Import the structures of an atlas archive (.bba), from the Atlas Root down to the Tree depth"""
+    bl_idname = "bb_tree_import.atlas"
+    bl_label = "Import atlas archive"
+
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob = bpy.props.StringProperty(default="*.bba", options={'HIDDEN'})
+
+    def execute(self, context):
+        bb_atlasImport(self.filepath)
+
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
 bpy.types.Scene.source =  bpy.props.StringProperty(subtype="FILE_PATH")
 
+# Binary mesh layout written by allen_sdk_wrapper/binary_mesh.py: 24 bytes header
+# (magic, version, vertex count, face count, flags) then float32 vertices and uint32 faces,
+# and float32 vertex normals if flags has BINARY_MESH_NORMALS
+BINARY_MESH_MAGIC = b"BBMESH\0\0"
+BINARY_MESH_HEADER = struct.Struct("<8sIIII")
+BINARY_MESH_NORMALS = 1
+
+# Atlas archive layout written by allen_sdk_wrapper/atlas_archive.py: 28 bytes header
+# (magic, version, index size, data offset), the JSON index, then the .bbm blobs
+ATLAS_MAGIC = b"BBATLAS\0"
+ATLAS_HEADER = struct.Struct("<8sIQQ")
+
+# Coarser levels of detail are exported as "Name (ACR).lod50.obj" next to "Name (ACR).obj"
+LOD_PATTERN = re.compile(r"\.lod\d+\.\w+$")
+
+def is_mesh_file(f):
+    return (f[-4:] == '.obj' or f[-4:] == '.bbm') and not LOD_PATTERN.search(f)
+
+def read_binary_mesh(filepath, offset=0):
+    with open(filepath, 'rb') as file:
+        file.seek(offset)
+        magic, version, n_verts, n_faces, flags = BINARY_MESH_HEADER.unpack(file.read(BINARY_MESH_HEADER.size))
+        if magic != BINARY_MESH_MAGIC or version != 1:
+            raise ValueError(filepath + " is not a supported binary mesh")
+        verts = np.fromfile(file, dtype="<f4", count=n_verts*3)
+        faces = np.fromfile(file, dtype="<u4", count=n_faces*3)
+        normals = np.fromfile(file, dtype="<f4", count=n_verts*3) if flags & BINARY_MESH_NORMALS else None
+    return verts, faces.astype(np.int32), normals
+
+def import_binary_mesh(filepath):
+    """Create the object from a .bbm file, without going through the obj importer"""
+    verts, faces, normals = read_binary_mesh(filepath)
+    name = re.sub(r"\.lod\d+$", "", os.path.basename(filepath)[:-4])
+    return new_mesh_object(name, verts, faces, normals)
+
+def new_mesh_object(name, verts, faces, normals=None):
+    """Create, link and select the object of the mesh given as flat vertex, face (and normal) arrays"""
+    n_faces = len(faces) // 3
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(verts) // 3)
+    mesh.vertices.foreach_set("co", verts)
+    mesh.loops.add(len(faces))
+    mesh.loops.foreach_set("vertex_index", faces)
+    mesh.polygons.add(n_faces)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, 3*n_faces, 3, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(n_faces, 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    if normals is not None:
+        # The exported normals, smooth across the faces instead of recomputed by Blender
+        mesh.polygons.foreach_set("use_smooth", np.ones(n_faces, dtype=bool))
+        mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set_from_vertices(normals.reshape(-1, 3))
+
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.objects.link(obj)
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select = True
+    bpy.context.scene.objects.active = obj
+    return obj
+
+def import_mesh_file(filepath):
+    """Import the .obj or .bbm file (preferring the .bbm of a .obj if asked), return the new object"""
+    lod_voxel_size = bpy.context.scene.bb_lod_voxel_size
+    for ext in ('.bbm', '.obj'):
+        lod_filepath = filepath[:-4] + '.lod' + str(lod_voxel_size) + ext
+        if lod_voxel_size > 0 and os.path.isfile(lod_filepath) and (ext == '.obj' or bpy.context.scene.bb_use_binary_meshes):
+            filepath = lod_filepath
+            break
+    if filepath[-4:] == '.obj' and bpy.context.scene.bb_use_binary_meshes and os.path.isfile(filepath[:-4] + '.bbm'):
+        filepath = filepath[:-4] + '.bbm'
+    if filepath[-4:] == '.bbm':
+        return import_binary_mesh(filepath)
+    bpy.ops.import_scene.obj(filepath=filepath,axis_forward="Y",axis_up="Z")
+    obj = bpy.context.selected_objects[0]
+    if obj.data.has_custom_normals:
+        # The importer keeps the "vn" normals but leaves the faces flat without smoothing groups
+        obj.data.polygons.foreach_set("use_smooth", np.ones(len(obj.data.polygons), dtype=bool))
+    return obj
+
 def remesh_when_importing(obj_to_remesh):
     obj_to_remesh.modifiers.new("import_remesh", type='REMESH')
     obj_to_remesh.modifiers['import_remesh'].octree_depth = bpy.context.scene.bb_remesh_octree_depth
@@ -159,10 +297,11 @@ def scale_object(obj_to_scale):
 def set_origin_and_mirror(obj_to_mirror):
     resolution = bpy.context.scene.bb_pix_scale
 
-
-    obj_to_mirror.modifiers.new("mirror", type='MIRROR')
-    obj_to_mirror.modifiers["mirror"].use_x = False
-    obj_to_mirror.modifiers["mirror"].use_y = True
+    # The origin is still put on the midline, so both kinds of meshes share it
+    if bpy.context.scene.bb_mirror_hemisphere:
+        obj_to_mirror.modifiers.new("mirror", type='MIRROR')
+        obj_to_mirror.modifiers["mirror"].use_x = False
+        obj_to_mirror.modifiers["mirror"].use_y = True
 
     saved_location = bpy.context.scene.cursor_location.copy()
     bpy.context.scene.objects.active = obj_to_mirror
@@ -177,7 +316,9 @@ def recursive_import(depth,dir, f_names=None):
         return new_meshes
 
     if f_names is None:
-        f_names = [f for f in os.listdir(dir) if os.path.isfile(os.path.join(dir, f)) and f[-4:] == '.obj']
+        f_names = [f for f in os.listdir(dir) if os.path.isfile(os.path.join(dir, f)) and is_mesh_file(f)]
+        # A structure exported in both formats is listed once, import_mesh_file picks the format
+        f_names = [f for f in f_names if f[-4:] == '.obj' or f[:-4] + '.obj' not in f_names]
     scn = bpy.context.scene
 
     for f in f_names:
@@ -190,10 +331,10 @@ def recursive_import(depth,dir, f_names=None):
 
         if depth == 0 or bpy.context.scene.bb_import_parents or not os.path.isdir(os.path.join(dir,acronym)):
 
-            bpy.ops.import_scene.obj(filepath=os.path.join(dir, f),axis_forward="Y",axis_up="Z")
-            current_mesh = bpy.context.selected_objects[0]
+            current_mesh = import_mesh_file(os.path.join(dir, f))
 
-            if bpy.context.scene.bb_remesh_when_importing:
+            # A remeshed surface would lose the exported normals
+            if bpy.context.scene.bb_remesh_when_importing and not current_mesh.data.has_custom_normals:
                 remesh_when_importing(current_mesh)
             scale_object(current_mesh)
 
@@ -208,6 +349,73 @@ def recursive_import(depth,dir, f_names=None):
             set_origin_and_mirror(bpy.context.selected_objects[0])
     return new_meshes
 
+def read_atlas_index(filepath):
+    """(data offset, structures by id) of the atlas archive"""
+    with open(filepath, 'rb') as file:
+        magic, version, index_size, data_offset = ATLAS_HEADER.unpack(file.read(ATLAS_HEADER.size))
+        if magic != ATLAS_MAGIC or version != 1:
+            raise ValueError(filepath + " is not a supported atlas archive")
+        index = json.loads(file.read(index_size).decode("utf-8"))
+    return data_offset, {structure["id"]: structure for structure in index["structures"]}
+
+def import_atlas_mesh(filepath, data_offset, structure):
+    """Create the object of the structure from the archive, at the level of detail asked if available"""
+    meshes = {mesh["voxel_size"]: mesh for mesh in structure["meshes"]}
+    voxel_size = bpy.context.scene.bb_lod_voxel_size
+    mesh = meshes[voxel_size] if voxel_size in meshes else meshes[min(meshes)]
+    verts, faces, normals = read_binary_mesh(filepath, data_offset + mesh["offset"])
+    return new_mesh_object(structure["name"], verts, faces, normals)
+
+def atlas_import(depth, filepath, atlas, structure_ids):
+    """Same as recursive_import, the tree being the parent ids of the archive index"""
+    data_offset, structures, children = atlas
+    new_meshes = []
+    scn = bpy.context.scene
+
+    for structure_id in structure_ids:
+        structure = structures[structure_id]
+
+        childs = []
+        if depth!=0 and children.get(structure_id):
+            childs = atlas_import(depth-1, filepath, atlas, children[structure_id])
+
+        if depth == 0 or bpy.context.scene.bb_import_parents or not children.get(structure_id):
+            current_mesh = import_atlas_mesh(filepath, data_offset, structure)
+
+            # A remeshed surface would lose the exported normals
+            if bpy.context.scene.bb_remesh_when_importing and not current_mesh.data.has_custom_normals:
+                remesh_when_importing(current_mesh)
+            scale_object(current_mesh)
+
+        else:
+            current_mesh = bpy.data.objects.new(structure["name"], None )
+            scn.objects.link(current_mesh)
+
+        new_meshes.append(current_mesh)
+        for o in childs:
+            o.parent = current_mesh
+        if depth == 0 or bpy.context.scene.bb_import_parents or not children.get(structure_id):
+            set_origin_and_mirror(current_mesh)
+    return new_meshes
+
+def bb_atlasImport(filepath):
+    if bpy.ops.object.mode_set.poll():
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    # The index is read once, no directory is listed
+    data_offset, structures = read_atlas_index(filepath)
+    children = {}
+    for structure in structures.values():
+        if structure["parent_id"] in structures:
+            children.setdefault(structure["parent_id"], []).append(structure["id"])
+
+    root = bpy.context.scene.bb_atlas_root.strip()
+    if root:
+        roots = [structure["id"] for structure in structures.values() if structure["acronym"] == root]
+    else:
+        roots = [structure["id"] for structure in structures.values() if structure["parent_id"] not in structures]
+    atlas_import(bpy.context.scene.bb_tree_depth, filepath, (data_offset, structures, children), roots)
+
 def bb_treeImport(dir,files):
     if bpy.ops.object.mode_set.poll():
         bpy.ops.object.mode_set(mode='OBJECT')
@@ -215,7 +423,7 @@ def bb_treeImport(dir,files):
     tree_depth = bpy.context.scene.bb_tree_depth
 
     for f in files:
-        if f[-4:] == '.obj':
+        if is_mesh_file(f):
             parent_structure = recursive_import(tree_depth,dir,[f])
 
 
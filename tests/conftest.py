@@ -0,0 +1,88 @@
+#    Shared fixtures of the allen_sdk_wrapper tests: a small synthetic atlas,
+#    run through the pipeline with LocalAllenApi instead of the network
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import sys
+import numpy as np
+import pytest
+from skimage.draw import ellipsoid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "allen_sdk_wrapper"))
+
+import brain_structures_export
+from label_index import LabelIndex
+
+SHAPE = (40, 48, 36) # (AP, ML, DV), the midline is at ML 24
+
+
+def structure(structure_id, acronym, name, path):
+    return {"id": structure_id, "acronym": acronym, "name": name, "structure_id_path": path,
+            "rgb_triplet": [128, 128, 128], "graph_id": 1, "graph_order": 0, "structure_set_ids": []}
+
+def synthetic_atlas():
+    """(annotation, structure graph): an ellipsoid brain with nested, touching and one-sided structures
+
+    root > grey > CH > {A, B/C}, and grey > D. A and B/C touch each other, D only
+    lies in the right hemisphere. Some voxels of the brain are only labelled CH or grey.
+    """
+    annotation = np.zeros(SHAPE, dtype=np.uint32)
+    brain = ellipsoid(16, 20, 14)[1:-1, 1:-1, 1:-1]
+    annotation[3:3+brain.shape[0], 3:3+brain.shape[1], 3:3+brain.shape[2]][brain] = 8
+    cerebrum = ellipsoid(10, 14, 8)[1:-1, 1:-1, 1:-1]
+    annotation[9:9+cerebrum.shape[0], 9:9+cerebrum.shape[1], 9:9+cerebrum.shape[2]][cerebrum] = 567
+    alpha = ellipsoid(5, 4, 4)[1:-1, 1:-1, 1:-1]
+    annotation[12:12+alpha.shape[0], 12:12+alpha.shape[1], 12:12+alpha.shape[2]][alpha] = 1000
+    annotation[17:24, 14:20, 13:19] = 1001
+    annotation[10:16, 30:36, 26:30] = 1002
+    graph = [structure(997, "root", "root", [997]),
+             structure(8, "grey", "Basic cell groups and regions", [997, 8]),
+             structure(567, "CH", "Cerebrum", [997, 8, 567]),
+             structure(1000, "A", "Alpha", [997, 8, 567, 1000]),
+             structure(1001, "B/C", "Beta", [997, 8, 567, 1001]),
+             structure(1002, "D", "Delta", [997, 8, 1002])]
+    return annotation, graph
+
+def triangles(verts, faces):
+    """Sorted rows of the 9 coordinates of each triangle, from its smallest rotation
+
+    Two meshes have the same rows when they have the same triangles wound the same way,
+    whatever the order and the indices of their vertices.
+    """
+    corners = np.asarray(verts)[np.asarray(faces)]
+    rotations = np.stack([np.roll(corners, -r, axis=1).reshape(len(corners), 9) for r in range(3)], axis=1)
+    smallest = np.lexsort(rotations.transpose(2, 0, 1)[::-1])[:, 0]
+    rows = rotations[np.arange(len(corners)), smallest]
+    return rows[np.lexsort(rows.T[::-1])]
+
+def signed_volume(verts, faces):
+    """Volume enclosed by a closed mesh, positive when its faces are wound outward"""
+    a, b, c = (verts[faces[:, i]] for i in range(3))
+    return np.einsum("ij,ij->i", a, np.cross(b, c)).sum() / 6.0
+
+def nrrd_order(annotation):
+    """Annotation in the axis order of the Allen nrrd files, undoing annotation_volume.reorient"""
+    return np.ascontiguousarray(np.swapaxes(annotation[:, :, ::-1], 1, 2))
+
+@pytest.fixture
+def atlas():
+    return synthetic_atlas()
+
+@pytest.fixture
+def label_index(atlas, monkeypatch):
+    """LabelIndex of the synthetic atlas, also set as the one used by export_obj"""
+    index = LabelIndex(atlas[0], atlas[1], (25, 25, 25))
+    monkeypatch.setattr(brain_structures_export, "label_index", index)
+    return index
@@ -0,0 +1,104 @@
+#    Tests of atlas_archive: the meshes of a whole export packed in one file and read back
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import numpy as np
+import pytest
+
+import brain_structures_export
+from atlas_archive import ALIGNMENT, HEADER, MAGIC, AtlasArchive, write_atlas
+from binary_mesh import read_mesh, read_normals
+from structure_index import build_structure_index
+
+RESOLUTION = (25, 25, 25)
+
+
+@pytest.fixture
+def archive(label_index, atlas, tmp_path):
+    """(path, report) of the archive of an export of grey, CH with LODs, A with normals, B/C without
+    binary meshes and D, which has no voxel in the left hemisphere"""
+    path = str(tmp_path) + "/"
+    options = {8: {"binary": True}, 567: {"binary": True, "lod_sizes": [50, 100]},
+               1000: {"binary": True, "normals": True}, 1001: {}, 1002: {"binary": True}}
+    report = [{"id": structure_id, "name": str(structure_id),
+               "files": brain_structures_export.export_obj(structure_id, str(structure_id), path, **options[structure_id])}
+              for structure_id in options]
+    archive_path = str(tmp_path / "atlas.bba")
+    write_atlas(archive_path, report, build_structure_index(atlas[1]), RESOLUTION)
+    return archive_path, report
+
+def bbm_file(entry, suffix=".bbm"):
+    return next(file for file in entry["files"] if os.path.basename(file) == entry["name"] + suffix)
+
+def test_index(archive):
+    path, report = archive
+    atlas = AtlasArchive(path)
+    assert atlas.resolution == RESOLUTION
+    # No binary mesh, no voxel: left out
+    assert list(atlas.structures) == [8, 567, 1000]
+    assert atlas.structures[567]["acronym"] == "CH" and atlas.structures[567]["parent_id"] == 8
+    assert atlas.voxel_sizes(567) == [25, 50, 100]
+    assert atlas.voxel_sizes(1000) == [25]
+    # The parent of grey is not in the archive, the children of D neither
+    assert atlas.children(997) == [8]
+    assert atlas.children(8) == [567]
+    assert atlas.children(567) == [1000]
+    verts = read_mesh(bbm_file(report[0]))[0]
+    assert atlas.structures[8]["bounds"] == [verts.min(axis=0).tolist(), verts.max(axis=0).tolist()]
+
+def test_layout(archive):
+    path = archive[0]
+    atlas = AtlasArchive(path)
+    with open(path, 'rb') as file:
+        magic, version, index_size, data_offset = HEADER.unpack(file.read(HEADER.size))
+    assert magic == MAGIC and data_offset == atlas.data_offset
+    assert data_offset % ALIGNMENT == 0 and HEADER.size + index_size <= data_offset
+    meshes = sorted((mesh["offset"], mesh["size"]) for structure in atlas.structures.values()
+                    for mesh in structure["meshes"])
+    assert meshes[0][0] == 0
+    for (offset, size), (next_offset, _) in zip(meshes, meshes[1:]):
+        assert next_offset % ALIGNMENT == 0 and offset + size <= next_offset < offset + size + ALIGNMENT
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_meshes(archive, mmap):
+    path, report = archive
+    atlas = AtlasArchive(path)
+    for entry in report[:3]:
+        for voxel_size in atlas.voxel_sizes(entry["id"]):
+            suffix = ".bbm" if voxel_size == 25 else ".lod{}.bbm".format(voxel_size)
+            verts, faces = read_mesh(bbm_file(entry, suffix))
+            archived_verts, archived_faces = atlas.mesh(entry["id"], voxel_size, mmap)
+            assert np.array_equal(archived_verts, verts) and np.array_equal(archived_faces, faces)
+            mesh = next(mesh for mesh in atlas.structures[entry["id"]]["meshes"] if mesh["voxel_size"] == voxel_size)
+            assert (mesh["vertex_count"], mesh["face_count"]) == (len(verts), len(faces))
+    # The full resolution by default
+    assert np.array_equal(atlas.mesh(567)[1], read_mesh(bbm_file(report[1]))[1])
+    assert np.array_equal(atlas.normals(1000, mmap=mmap), read_normals(bbm_file(report[2])))
+    assert atlas.normals(8, mmap=mmap) is None
+    with pytest.raises(KeyError):
+        atlas.mesh(567, 75)
+    with pytest.raises(KeyError):
+        atlas.mesh(1001)
+
+def test_bad_archive(archive):
+    path = archive[0]
+    with open(path, 'r+b') as file:
+        file.write(b"NOTATLAS")
+    with pytest.raises(ValueError):
+        AtlasArchive(path)
+    with open(path, 'r+b') as file:
+        file.write(HEADER.pack(MAGIC, 2, 0, 0))
+    with pytest.raises(ValueError):
+        AtlasArchive(path)
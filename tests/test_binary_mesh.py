@@ -0,0 +1,75 @@
+#    Tests of binary_mesh: .bbm files read back as written, with and without normals
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+from binary_mesh import FLAG_NORMALS, HEADER, read_header, read_mesh, read_normals, write_mesh, write_mesh_chunks
+
+
+def random_mesh(seed, n_verts=11, n_faces=7):
+    random = np.random.RandomState(seed)
+    verts = random.rand(n_verts, 3) * 100
+    faces = random.randint(0, n_verts, (n_faces, 3))
+    normals = random.rand(n_verts, 3) - 0.5
+    return verts, faces, normals / np.linalg.norm(normals, axis=1)[:, None]
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, mmap):
+    verts, faces, normals = random_mesh(0)
+    path = str(tmp_path / "mesh.bbm")
+    write_mesh(path, verts, faces)
+    assert read_header(path) == (11, 7, 0)
+    stored_verts, stored_faces = read_mesh(path, mmap=mmap)
+    assert stored_verts.dtype == np.float32 and stored_faces.dtype == np.uint32
+    assert np.array_equal(stored_verts, verts.astype(np.float32))
+    assert np.array_equal(stored_faces, faces)
+    assert read_normals(path, mmap=mmap) is None
+    write_mesh(path, verts, faces, normals)
+    assert read_header(path) == (11, 7, FLAG_NORMALS)
+    assert np.array_equal(read_mesh(path, mmap=mmap)[1], faces)
+    assert np.array_equal(read_normals(path, mmap=mmap), normals.astype(np.float32))
+
+def test_chunks_and_offsets(tmp_path):
+    verts, faces, normals = random_mesh(1, 20, 30)
+    path = str(tmp_path / "mesh.bbm")
+    write_mesh_chunks(path, 20, 30, [verts[:5], verts[5:]], [faces[:17], faces[17:]], [normals[:12], normals[12:]])
+    # The same mesh behind 16 bytes of something else, as in an atlas archive
+    packed = str(tmp_path / "packed")
+    with open(packed, 'wb') as file, open(path, 'rb') as mesh:
+        file.write(b"x" * 16 + mesh.read())
+    for mmap in (True, False):
+        stored_verts, stored_faces = read_mesh(packed, 16, mmap)
+        assert np.array_equal(stored_verts, verts.astype(np.float32))
+        assert np.array_equal(stored_faces, faces)
+        assert np.array_equal(read_normals(packed, 16, mmap), normals.astype(np.float32))
+
+def test_empty_mesh(tmp_path):
+    path = str(tmp_path / "empty.bbm")
+    write_mesh(path, np.zeros((0, 3)), np.zeros((0, 3), dtype=int), np.zeros((0, 3)))
+    verts, faces = read_mesh(path)
+    assert verts.shape == (0, 3) and faces.shape == (0, 3)
+    assert read_normals(path).shape == (0, 3)
+
+def test_bad_files(tmp_path):
+    path = str(tmp_path / "mesh.bbm")
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(b"NOTAMESH", 1, 0, 0, 0))
+    with pytest.raises(ValueError):
+        read_mesh(path)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(b"BBMESH\0\0", 2, 0, 0, 0))
+    with pytest.raises(ValueError):
+        read_header(path)
@@ -0,0 +1,56 @@
+#    Tests of chunked_meshing: meshing brick by brick gives the surface of a single marching cubes
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+from chunked_meshing import downsample_chunked, marching_cubes, marching_cubes_chunked, weld
+from lod import downsample_mask
+from conftest import signed_volume, triangles
+
+
+def box(label_index, structure_id):
+    lower, upper = label_index.bounding_box(structure_id)
+    return (np.maximum(lower - 1, 0), np.minimum(upper + 1, label_index.shape))
+
+def dense_mesh(mask, lower, upper):
+    verts, faces = marching_cubes(mask.cropped(lower, upper), 0)
+    verts, faces = weld(np.round(verts, 4), faces)
+    return verts + lower, faces
+
+@pytest.mark.parametrize("structure_id, brick_size", [(8, 10), (8, 17), (567, 7), (1002, 4)])
+def test_chunked_equals_dense(label_index, structure_id, brick_size):
+    mask = label_index.structure_mask(structure_id)
+    lower, upper = box(label_index, structure_id)
+    verts, faces = dense_mesh(mask, lower, upper)
+    chunked_verts, chunked_faces = marching_cubes_chunked(mask, lower, upper, 0, brick_size)
+    assert len(chunked_verts) == len(verts)
+    assert np.array_equal(triangles(chunked_verts, chunked_faces), triangles(verts, faces))
+
+def test_meshes_are_wound_outward(label_index):
+    mask = label_index.structure_mask(1001)
+    lower, upper = box(label_index, 1001)
+    verts, faces = dense_mesh(mask, lower, upper)
+    # At level 0 the surface goes through the centers of the voxels around the 7x6x6 voxel box
+    assert 7 * 6 * 6 < signed_volume(verts, faces) < 8 * 7 * 7
+    verts, faces = marching_cubes_chunked(mask, lower, upper, 0, 4)
+    assert signed_volume(verts, faces) > 0
+
+def test_downsample_chunked_equals_dense(label_index):
+    mask = label_index.structure_mask(567)
+    lower, upper = box(label_index, 567)
+    for factor in (2, 3):
+        expected = downsample_mask(mask.cropped(lower, upper), factor)
+        assert np.allclose(downsample_chunked(mask, lower, upper, factor, brick_size=7), expected)
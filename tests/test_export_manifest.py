@@ -0,0 +1,55 @@
+#    Tests of export_manifest: a structure is current only if nothing it was exported from changed
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+
+from export_manifest import ExportManifest
+
+PARAMS = {"hemisphere": "left", "resolution": [25, 25, 25]}
+
+
+def recorded_manifest(tmp_path):
+    mesh = str(tmp_path / "mesh.obj")
+    with open(mesh, 'w') as file:
+        file.write("v 0 0 0\n")
+    manifest = ExportManifest(str(tmp_path / "export_manifest.json"))
+    manifest.record(1000, "voxels", PARAMS, [mesh], {"voxel_count": 3})
+    manifest.record(1002, "other voxels", PARAMS, [])
+    manifest.save()
+    return manifest, mesh
+
+def test_round_trip(tmp_path):
+    manifest, mesh = recorded_manifest(tmp_path)
+    loaded = ExportManifest(manifest.path)
+    assert loaded.is_current(1000, "voxels", dict(PARAMS))
+    assert loaded.files(1000) == [mesh]
+    assert loaded.statistics(1000) == {"voxel_count": 3}
+    # A structure without a surface has no file and stays current
+    assert loaded.is_current(1002, "other voxels", PARAMS)
+    assert loaded.statistics(1002) == {}
+    assert not os.path.exists(manifest.path + ".tmp")
+
+def test_stale_entries(tmp_path):
+    manifest, mesh = recorded_manifest(tmp_path)
+    assert not manifest.is_current(1001, "voxels", PARAMS)
+    assert not manifest.is_current(1000, "changed voxels", PARAMS)
+    assert not manifest.is_current(1000, "voxels", dict(PARAMS, hemisphere="right"))
+    with open(mesh, 'a') as file:
+        file.write("v 0 0 1\n")
+    assert not manifest.is_current(1000, "voxels", PARAMS)
+    os.remove(mesh)
+    assert not manifest.is_current(1000, "voxels", PARAMS)
+    manifest.forget(1002)
+    assert not manifest.is_current(1002, "other voxels", PARAMS)
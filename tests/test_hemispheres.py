@@ -0,0 +1,95 @@
+#    Tests of the hemisphere modes: on a symmetric annotation, mirroring the left hemisphere
+#    gives the mesh of both hemispheres
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+from collections import Counter
+import numpy as np
+import pytest
+
+import brain_structures_export
+from binary_mesh import read_mesh
+from label_index import LabelIndex
+from surface_nets import SurfaceNet
+from conftest import signed_volume, synthetic_atlas
+
+MIDLINE = 23.5 # Between the last left column (23) and the first right one (24)
+STRUCTURES = (8, 567, 1000, 1001)
+
+
+def symmetric_atlas():
+    """The synthetic atlas with its right hemisphere replaced by the reflection of the left one"""
+    annotation, graph = synthetic_atlas()
+    middle = annotation.shape[1] // 2
+    annotation[:, middle:] = annotation[:, :middle][:, ::-1]
+    return annotation, graph
+
+def export(structure_id, path, hemisphere, **options):
+    files = brain_structures_export.export_obj(structure_id, "{}.{}".format(structure_id, hemisphere), path,
+                                               hemisphere=hemisphere, binary=True, **options)
+    meshes = [file for file in files if file.endswith(".bbm")]
+    return [tuple(np.asarray(array, dtype=float if array.dtype.kind == "f" else np.int64) for array in read_mesh(mesh))
+            for mesh in meshes]
+
+def vertex_set(verts):
+    return set(map(tuple, np.round(verts, 4).tolist()))
+
+def is_closed(faces):
+    edges = Counter(map(tuple, np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]).tolist()))
+    return all(edges[(b, a)] == count for (a, b), count in edges.items())
+
+@pytest.fixture
+def symmetric_index(monkeypatch):
+    annotation, graph = symmetric_atlas()
+    index = LabelIndex(annotation, graph, (25, 25, 25))
+    monkeypatch.setattr(brain_structures_export, "label_index", index)
+    return index
+
+@pytest.mark.parametrize("brick_size", [None, 8])
+def test_mirrored_equals_both(symmetric_index, tmp_path, brick_size):
+    path = str(tmp_path) + "/"
+    for structure_id in STRUCTURES:
+        [(verts, faces)] = export(structure_id, path, "both", brick_size=brick_size)
+        [(mirrored_verts, mirrored_faces)] = export(structure_id, path, "mirrored", brick_size=brick_size)
+        assert is_closed(mirrored_faces)
+        assert vertex_set(mirrored_verts) == vertex_set(verts)
+        assert signed_volume(mirrored_verts, mirrored_faces) == pytest.approx(signed_volume(verts, faces))
+
+def test_mirrored_surface_nets_equal_both(symmetric_index, tmp_path, monkeypatch):
+    annotation = symmetric_atlas()[0]
+    path = str(tmp_path) + "/"
+    for hemisphere, ml_range in (("both", None), ("mirrored", (0, 24))):
+        monkeypatch.setattr(brain_structures_export, "surface_net", SurfaceNet(annotation, ml_range))
+        meshes = {structure_id: export(structure_id, path, hemisphere, surface_nets=True)[0]
+                  for structure_id in STRUCTURES}
+        if hemisphere == "both":
+            both = meshes
+    for structure_id in STRUCTURES:
+        verts, faces = meshes[structure_id]
+        assert is_closed(faces)
+        assert vertex_set(verts) == vertex_set(both[structure_id][0])
+        # The net quads are not planar and a reflected quad is split along the other diagonal
+        assert signed_volume(verts, faces) == pytest.approx(signed_volume(*both[structure_id]), rel=1e-3)
+
+@pytest.mark.parametrize("brick_size", [None, 8])
+def test_mirrored_lods_are_symmetric_about_the_midline(symmetric_index, tmp_path, brick_size):
+    for structure_id in STRUCTURES:
+        meshes = export(structure_id, str(tmp_path) + "/", "mirrored", brick_size=brick_size, lod_sizes=[50, 75])
+        assert len(meshes) == 3
+        for verts, faces in meshes:
+            reflected = verts.copy()
+            reflected[:, 1] = 2 * MIDLINE - reflected[:, 1]
+            assert is_closed(faces)
+            assert vertex_set(reflected) == vertex_set(verts)
+            assert signed_volume(verts, faces) > 0
@@ -0,0 +1,75 @@
+#    Tests of instrumentation: the stage timer, the export log and its summary
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import pytest
+
+from instrumentation import ExportLog, StageTimer, export_record, latest_records, read_log, summarize
+
+
+def entry(structure_id, name, seconds=None, timings=None, status="exported", statistics=None):
+    return {"id": structure_id, "name": name, "status": status, "worker": 1, "seconds": seconds,
+            "timings": timings or {}, "statistics": statistics or {}, "files": ["a.obj"], "error": ""}
+
+def test_stage_timer():
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage("meshing"):
+            pass
+    with pytest.raises(RuntimeError):
+        with timer.stage("writing"):
+            raise RuntimeError()
+    assert sorted(timer.timings) == ["meshing", "writing"]
+    assert all(seconds >= 0 for seconds in timer.timings.values())
+
+def test_log_round_trip(tmp_path):
+    path = str(tmp_path / "export_log.jsonl")
+    statistics = {"voxel_count": 120, "bbox_lower": [1, 2, 3], "bbox_upper": [4, 6, 8], "face_count": 40}
+    log = ExportLog(path)
+    log.write(entry(567, "CH", 2.5, {"meshing": 2.0}, statistics=statistics))
+    log.close()
+    # A resumed run appends to the log
+    log = ExportLog(path)
+    log.write(entry(567, "CH", status="skipped"))
+    log.close()
+    first, second = read_log(path)
+    assert first == export_record(entry(567, "CH", 2.5, {"meshing": 2.0}, statistics=statistics))
+    assert first["bbox_size"] == [3, 4, 5] and first["voxel_count"] == 120 and first["files"] == 1
+    assert first["vertex_count"] is None
+    assert second["status"] == "skipped" and second["bbox_size"] is None and second["seconds"] is None
+
+def test_latest_records():
+    records = [export_record(entry(1, "a", 1.0)), export_record(entry(2, "b", 2.0)),
+               export_record(entry(1, "a", status="skipped")), export_record(entry(2, "b", 3.0)),
+               export_record(entry(3, "c", status="skipped"))]
+    # The skip does not hide the timed export, a later export replaces the earlier one
+    assert [(record["id"], record["seconds"]) for record in latest_records(records)] == [
+        (1, 1.0), (2, 3.0), (3, None)]
+
+def test_summarize():
+    records = [export_record(entry(1, "a", 1.0, {"meshing": 0.75, "writing": 0.25}, statistics={"voxel_count": 10})),
+               export_record(entry(2, "b", 3.0, {"writing": 2.0, "meshing": 1.0}, statistics={"face_count": 7})),
+               export_record(entry(3, "c", 0.5)),
+               export_record(entry(4, "d", status="skipped"))]
+    lines = summarize(records, count=2).splitlines()
+    assert lines[0] == "3 structures exported in 4.5 s (summed over the workers)"
+    # Stages by decreasing time, percentages of the total
+    assert lines[1].split() == ["writing", "2.2", "s", "50.0", "%"]
+    assert lines[2].split() == ["meshing", "1.8", "s", "38.9", "%"]
+    assert lines[3] == "Slowest structures:"
+    assert lines[5].split() == ["3.00", "writing", "0", "7", "b"]
+    assert lines[6].split() == ["1.00", "meshing", "10", "0", "a"]
+    assert len(lines) == 7
+    assert summarize([records[2]]).splitlines()[-1].split() == ["0.50", "-", "0", "0", "c"]
+    assert summarize([]).splitlines()[0] == "0 structures exported in 0.0 s (summed over the workers)"
@@ -0,0 +1,86 @@
+#    Tests of label_index: structure masks, checksums and the on-disk store
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import numpy as np
+
+import label_index as label_index_module
+from label_index import LabelIndex, cached_label_index
+
+STRUCTURE_LABELS = {997: [8, 567, 1000, 1001, 1002], 8: [8, 567, 1000, 1001, 1002], 567: [567, 1000, 1001],
+                    1000: [1000], 1001: [1001], 1002: [1002]}
+
+
+def test_masks_match_the_annotation(atlas, label_index):
+    annotation = atlas[0]
+    for structure_id, labels in STRUCTURE_LABELS.items():
+        expected = np.isin(annotation, labels)
+        assert np.array_equal(label_index.mask(structure_id), expected)
+        assert label_index.voxel_count(structure_id) == expected.sum()
+        lower, upper = label_index.bounding_box(structure_id)
+        assert lower.tolist() == np.argwhere(expected).min(axis=0).tolist()
+        assert upper.tolist() == (np.argwhere(expected).max(axis=0) + 1).tolist()
+        for plane in (0, 13, 20):
+            assert np.array_equal(label_index.slice_mask(structure_id, plane), expected[plane])
+
+def test_slab_scan_matches_a_single_slab(atlas, label_index, monkeypatch):
+    monkeypatch.setattr(label_index_module, "SCAN_VOXELS", 100)
+    small_slabs = LabelIndex(atlas[0], atlas[1], (25, 25, 25))
+    assert np.array_equal(small_slabs._starts, label_index._starts)
+    assert np.array_equal(small_slabs._stops, label_index._stops)
+    assert small_slabs._ranges == label_index._ranges
+
+def test_bottom_up_masks(label_index):
+    ids = list(STRUCTURE_LABELS)
+    masks = dict(label_index.bottom_up_masks(ids))
+    assert sorted(masks) == sorted(ids)
+    for structure_id in ids:
+        assert np.array_equal(masks[structure_id].dense(), label_index.mask(structure_id))
+
+def test_checksums_follow_the_structure_voxels(atlas):
+    annotation, graph = atlas
+    before = LabelIndex(annotation, graph)
+    changed = annotation.copy()
+    changed[10:12, 30:32, 26:28] = 8 # Inside D, relabelled grey
+    after = LabelIndex(changed, graph)
+    assert before.checksum(1000) == after.checksum(1000)
+    assert before.checksum(1002) != after.checksum(1002)
+    assert before.checksum(8) != after.checksum(8)
+    assert before.volume_checksum() != after.volume_checksum()
+
+def test_store_round_trip(atlas, label_index, tmp_path, monkeypatch):
+    monkeypatch.setattr(label_index_module, "STORE_CHUNK_RUNS", 50) # several chunks
+    path = str(tmp_path / "index.npz")
+    label_index.save(path)
+    loaded = LabelIndex.load(path, atlas[1], (25, 25, 25))
+    assert np.array_equal(loaded._starts, label_index._starts)
+    assert np.array_equal(loaded._stops, label_index._stops)
+    for structure_id in STRUCTURE_LABELS:
+        assert loaded.checksum(structure_id) == label_index.checksum(structure_id)
+        assert np.array_equal(loaded.mask(structure_id), label_index.mask(structure_id))
+    assert loaded.volume_checksum() == label_index.volume_checksum()
+
+def test_cached_label_index_is_keyed_by_the_annotation(atlas, tmp_path):
+    annotation, graph = atlas
+    directory = str(tmp_path)
+    first = cached_label_index(annotation, graph, (25, 25, 25), directory)
+    stores = os.listdir(directory)
+    second = cached_label_index(annotation, graph, (25, 25, 25), directory)
+    assert os.listdir(directory) == stores
+    assert np.array_equal(first._starts, second._starts)
+    changed = annotation.copy()
+    changed[0, 0, 0] = 8
+    cached_label_index(changed, graph, (25, 25, 25), directory)
+    assert len(os.listdir(directory)) == 2
@@ -0,0 +1,53 @@
+#    Tests of the levels of detail: their voxel sizes and the files written for them
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+import pytest
+
+import brain_structures_export
+from lod import lod_factor, lod_path, lod_voxel_size
+
+
+def test_lod_factor():
+    assert lod_factor(50, (25, 25, 25)) == 2
+    assert lod_factor(25, (25, 25, 25)) == 1
+    for size in (60, 0, -50):
+        with pytest.raises(ValueError):
+            lod_factor(size, (25, 25, 25))
+    with pytest.raises(ValueError):
+        lod_factor(50, (25, 10, 25))
+
+def test_lod_paths():
+    path = lod_path("meshes/CH/Cerebrum (CH).obj", 100)
+    assert path == "meshes/CH/Cerebrum (CH).lod100.obj"
+    assert lod_voxel_size(path, (25, 25, 25)) == 100
+    assert lod_voxel_size("meshes/CH/Cerebrum (CH).bbm", (25, 25, 25)) == 25
+
+def test_lod_files(label_index, tmp_path):
+    path = str(tmp_path) + "/"
+    written = brain_structures_export.export_obj(567, "CH", path, binary=True, lod_sizes=[50, 100])
+    assert sorted(os.path.basename(file) for file in written) == [
+        "CH.bbm", "CH.lod100.bbm", "CH.lod100.obj", "CH.lod50.bbm", "CH.lod50.obj", "CH.obj"]
+
+def test_bad_lod_size_writes_nothing(label_index, tmp_path):
+    with pytest.raises(ValueError):
+        brain_structures_export.export_obj(567, "CH", str(tmp_path) + "/", binary=True, lod_sizes=[50, 60])
+    assert os.listdir(str(tmp_path)) == []
+
+@pytest.mark.parametrize("sizes", [["60"], ["50", "0"]])
+def test_bad_lod_size_is_a_usage_error(tmp_path, sizes):
+    with pytest.raises(SystemExit):
+        brain_structures_export.parse_arguments([str(tmp_path), "--cache-dir", str(tmp_path), "--resolution", "25",
+                                                 "--lod-sizes"] + sizes)
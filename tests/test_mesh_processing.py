@@ -0,0 +1,108 @@
+#    Tests of mesh_processing: welding, simplification and smoothing of the exported meshes
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+from collections import Counter
+import numpy as np
+import pytest
+
+import brain_structures_export
+from chunked_meshing import marching_cubes
+from instrumentation import StageTimer
+from mesh_processing import boundary_vertices, compact, decimate, process_mesh, smooth, weld_vertices
+from conftest import signed_volume
+
+OPTIONS_OFF = {"weld": False, "target_faces": None, "max_error": None, "smooth_iterations": 0}
+CUT = 23 # Last column of the left hemisphere, where its meshes are open
+
+
+def structure_mesh(label_index, structure_id, stop=None):
+    """Welded marching cubes mesh of the structure, cut open after the column stop - 1 if given"""
+    lower, upper = label_index.bounding_box(structure_id)
+    lower, upper = np.maximum(lower - 1, 0), np.minimum(upper + 1, label_index.shape)
+    if stop is not None:
+        upper[1] = stop
+    verts, faces = marching_cubes(label_index.structure_mask(structure_id).cropped(lower, upper), 0)
+    return weld_vertices(verts + lower, faces)
+
+def edge_faces(faces):
+    """Number of faces of every directed edge"""
+    return Counter(map(tuple, np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]).tolist()))
+
+def check_closed(faces):
+    edges = edge_faces(faces)
+    assert all(edges[(b, a)] == count for (a, b), count in edges.items())
+
+
+def test_postprocess_stage_only_with_an_option(label_index, tmp_path):
+    for postprocess, postprocessed in ((OPTIONS_OFF, False), (dict(OPTIONS_OFF, weld=True), True)):
+        timer = StageTimer()
+        brain_structures_export.export_obj(1000, "A", str(tmp_path) + "/", postprocess=postprocess, timer=timer,
+                                           lod_sizes=[50])
+        assert ("postprocess" in timer.timings) == postprocessed
+
+def test_weld_and_compact():
+    verts = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 1], [5, 5, 5]], dtype=float)
+    faces = np.array([[0, 1, 2], [0, 3, 2], [1, 2, 0], [0, 1, 1], [0, 1, 4], [0, 4, 1]])
+    verts, faces = weld_vertices(verts, faces)
+    # The duplicated vertex is merged, so is the repeated face; the degenerate face, the back to back
+    # pair and the unused vertex are dropped
+    assert len(verts) == 3 and len(faces) == 1
+    assert compact(verts, faces[:, ::-1])[1].tolist() == faces[:, ::-1].tolist()
+
+@pytest.mark.parametrize("target_faces", [100, 300, 1000])
+def test_face_budget(label_index, target_faces):
+    for structure_id in (8, 567, 1000):
+        verts, faces = structure_mesh(label_index, structure_id)
+        simplified_verts, simplified_faces = decimate(verts, faces, target_faces=target_faces)
+        assert len(simplified_faces) <= max(target_faces, len(faces) if len(faces) <= target_faces else 0)
+        check_closed(simplified_faces)
+        assert signed_volume(simplified_verts, simplified_faces) > 0
+
+@pytest.mark.parametrize("options", [{"target_faces": 300}, {"max_error": 2.0}, {"smooth_iterations": 10},
+                                     {"target_faces": 500, "smooth_iterations": 5}])
+def test_cut_stays_on_its_plane(label_index, options):
+    verts, faces = structure_mesh(label_index, 8, stop=CUT + 1)
+    border = boundary_vertices(faces, len(verts))
+    processed_verts, processed_faces = process_mesh(verts, faces, **options)
+    processed_border = boundary_vertices(processed_faces, len(processed_verts))
+    assert processed_border.any()
+    assert np.all(processed_verts[processed_border, 1] == CUT)
+    assert processed_verts[:, 1].max() == CUT
+    if "target_faces" not in options and "max_error" not in options:
+        # Without clustering the border is the same, vertex for vertex
+        assert np.array_equal(processed_verts[processed_border], verts[border])
+
+def test_smoothing_keeps_the_border(label_index):
+    verts, faces = structure_mesh(label_index, 567, stop=CUT + 1)
+    border = boundary_vertices(faces, len(verts))
+    smoothed = smooth(verts, faces, 10)
+    assert np.array_equal(smoothed[border], verts[border])
+    assert np.abs(smoothed[~border] - verts[~border]).max() > 0.1
+    # Taubin smoothing hardly shrinks the volume
+    closed_verts, closed_faces = structure_mesh(label_index, 567)
+    assert signed_volume(smooth(closed_verts, closed_faces, 10), closed_faces) == pytest.approx(
+        signed_volume(closed_verts, closed_faces), rel=0.05)
+
+def test_clustering_leaves_no_fins(label_index):
+    # Clustering folds thin parts into back to back faces: compact drops them. It can still pinch two
+    # sheets of the surface together on an edge of four faces, two each way (see decimate)
+    for structure_id in (8, 567, 1000, 1001):
+        verts, faces = structure_mesh(label_index, structure_id)
+        for options in ({"target_faces": 200}, {"target_faces": 500}, {"max_error": 3.0}, {"max_error": 4.0}):
+            simplified = decimate(verts, faces, **options)[1]
+            check_closed(simplified)
+            canonical = {tuple(np.roll(face, -np.argmin(face))) for face in simplified.tolist()}
+            assert not any(tuple(np.roll(face, -np.argmin(face))) in canonical for face in simplified[:, ::-1].tolist())
+            assert max(edge_faces(simplified).values()) <= 2
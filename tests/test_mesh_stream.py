@@ -0,0 +1,67 @@
+#    Tests of mesh_stream: the brick meshes spooled to disk are the chunked marching cubes mesh
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+import mesh_stream
+from binary_mesh import read_mesh, read_normals
+from chunked_meshing import brick_meshes, marching_cubes_chunked
+from mesh_processing import vertex_normals
+from mesh_stream import MeshSpool
+from conftest import triangles
+
+
+def box(label_index, structure_id):
+    lower, upper = label_index.bounding_box(structure_id)
+    return (np.maximum(lower - 1, 0), np.minimum(upper + 1, label_index.shape))
+
+def spooled(label_index, structure_id, brick_size, directory, normals=False):
+    mask = label_index.structure_mask(structure_id)
+    lower, upper = box(label_index, structure_id)
+    spool = MeshSpool(directory, normals=normals)
+    for brick in brick_meshes(mask, lower, upper, 0, brick_size):
+        spool.add(*brick)
+    return spool, marching_cubes_chunked(mask, lower, upper, 0, brick_size)
+
+def by_position(verts, values):
+    return values[np.lexsort(np.asarray(verts).T[::-1])]
+
+@pytest.mark.parametrize("brick_size", [6, 11])
+def test_streamed_equals_chunked(label_index, tmp_path, brick_size):
+    spool, (verts, faces) = spooled(label_index, 8, brick_size, str(tmp_path))
+    with spool:
+        streamed_verts = np.concatenate(list(spool.vertex_chunks()))
+        streamed_faces = np.concatenate(list(spool.face_chunks()))
+    assert len(streamed_verts) == len(verts)
+    assert np.array_equal(triangles(streamed_verts, streamed_faces), triangles(verts, faces))
+
+def test_written_files_and_normals(label_index, tmp_path, monkeypatch):
+    # Chunks of a few rows, so the files are written in many pieces
+    monkeypatch.setattr(mesh_stream, "CHUNK_ROWS", 100)
+    spool, (verts, faces) = spooled(label_index, 567, 7, str(tmp_path), normals=True)
+    with spool:
+        written = spool.write(str(tmp_path / "CH.obj"), binary=True)
+    assert written == [str(tmp_path / "CH.obj"), str(tmp_path / "CH.bbm")]
+    stored_verts, stored_faces = read_mesh(written[1])
+    assert np.array_equal(triangles(stored_verts, stored_faces), triangles(verts.astype(np.float32), faces))
+    # The normals of the vertices shared between bricks are completed across the bricks
+    assert np.allclose(by_position(stored_verts, read_normals(written[1])),
+                       by_position(verts, vertex_normals(verts, faces)), atol=1e-6)
+    with open(written[0]) as file:
+        lines = file.read().splitlines()
+    assert sum(line.startswith("v ") for line in lines) == len(verts)
+    assert sum(line.startswith("vn ") for line in lines) == len(verts)
+    assert sum(line.startswith("f ") for line in lines) == len(faces)
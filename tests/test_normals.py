@@ -0,0 +1,64 @@
+#    Tests of the exported vertex normals against the normals of scikit-image's marching cubes
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+import brain_structures_export
+from binary_mesh import read_mesh, read_normals
+from chunked_meshing import _lewiner, marching_cubes
+from mesh_processing import vertex_normals
+
+
+def reference_normals(mask, lower, upper):
+    """Unit normals of scikit-image's marching cubes (from the volume gradient) by rounded vertex position"""
+    verts, faces, normals = _lewiner(mask.cropped(lower, upper), 0)[:3]
+    positions, inverse = np.unique(np.round(verts + lower, 3), axis=0, return_inverse=True)
+    sums = np.zeros((len(positions), 3))
+    np.add.at(sums, inverse.reshape(-1), normals)
+    return {tuple(position): normal / np.linalg.norm(normal) for position, normal in zip(positions.tolist(), sums)}
+
+def agreement(verts, normals, reference):
+    """Cosines between the normals and the reference normals at the same vertices"""
+    expected = np.array([reference[tuple(position)] for position in np.round(verts, 3).tolist()])
+    return np.einsum("ij,ij->i", normals, expected)
+
+def check(cosines):
+    # Never on the other side; the face normals only depart from the gradient at corners and
+    # tips, where they can be perpendicular to it
+    assert cosines.min() > -1e-9
+    assert np.mean(cosines < 0.5) < 0.02
+    assert np.median(cosines) > 0.9
+
+@pytest.mark.parametrize("structure_id", [8, 567, 1000, 1001])
+def test_vertex_normals_follow_the_gradient(label_index, structure_id):
+    mask = label_index.structure_mask(structure_id)
+    lower, upper = label_index.bounding_box(structure_id)
+    lower, upper = np.maximum(lower - 1, 0), np.minimum(upper + 1, label_index.shape)
+    verts, faces = marching_cubes(mask.cropped(lower, upper), 0)
+    check(agreement(verts + lower, vertex_normals(verts, faces), reference_normals(mask, lower, upper)))
+
+@pytest.mark.parametrize("brick_size", [None, 8])
+def test_stored_normals_follow_the_gradient(label_index, tmp_path, brick_size):
+    path = str(tmp_path) + "/"
+    for structure_id in (8, 567, 1001):
+        files = brain_structures_export.export_obj(structure_id, str(structure_id), path, hemisphere="both",
+                                                   binary=True, brick_size=brick_size, normals=True)
+        bbm = [name for name in files if name.endswith(".bbm")][0]
+        verts, faces = read_mesh(bbm)
+        mask = label_index.structure_mask(structure_id)
+        lower, upper = label_index.bounding_box(structure_id)
+        lower, upper = np.maximum(lower - 1, 0), np.minimum(upper + 1, label_index.shape)
+        check(agreement(verts, read_normals(bbm), reference_normals(mask, lower, upper)))
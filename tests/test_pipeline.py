@@ -0,0 +1,86 @@
+#    End to end tests of brain_structures_export.main on the synthetic atlas, served by LocalAllenApi
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import csv
+import os
+import numpy as np
+import pytest
+
+import brain_structures_export
+from allen_cache import LocalAllenApi
+from binary_mesh import read_mesh
+from instrumentation import read_log
+from resample import resample_annotation
+from conftest import nrrd_order, signed_volume
+
+
+def api(atlas, resolution=25):
+    return LocalAllenApi({1: atlas[1]}, {resolution: nrrd_order(atlas[0])})
+
+def read_report(output_root):
+    with open(os.path.join(output_root, "export_report.csv"), newline='') as file:
+        return {int(row["id"]): row for row in csv.DictReader(file)}
+
+def run(tmp_path, api, *options):
+    output_root = str(tmp_path / "meshes")
+    brain_structures_export.main([output_root, "--cache-dir", str(tmp_path / "cache"), "--resolution", "25"]
+                                 + list(options), api=api)
+    return output_root
+
+@pytest.fixture(autouse=True)
+def restore_globals(monkeypatch):
+    """main sets the label index and surface net of the module, put back after each test"""
+    monkeypatch.setattr(brain_structures_export, "label_index", None)
+    monkeypatch.setattr(brain_structures_export, "surface_net", None)
+
+@pytest.mark.parametrize("options", [["--workers", "1"], ["--workers", "2", "--brick-size", "8"],
+                                     ["--workers", "2", "--bottom-up"], ["--workers", "1", "--surface-nets"]])
+def test_export_and_rerun(atlas, tmp_path, options):
+    output_root = run(tmp_path, api(atlas), "--lod-sizes", "50", *options)
+    report = read_report(output_root)
+    assert sorted(report) == [8, 567, 997, 1000, 1001, 1002]
+    # D only lies in the right hemisphere, the left one is exported by default
+    assert report[1002]["status"] == "empty"
+    assert all(report[i]["status"] == "exported" for i in (8, 567, 997, 1000, 1001))
+    for structure_id in (8, 567, 997, 1000, 1001):
+        files = report[structure_id]["files"].split(";")
+        assert all(os.path.isfile(path) for path in files)
+        verts, faces = read_mesh([path for path in files if path.endswith(".bbm")][0])
+        assert len(faces) and signed_volume(np.asarray(verts, dtype=float), np.asarray(faces)) > 0
+        # Left hemisphere: ML below the midline, a half voxel past it at most on the open cut
+        assert np.asarray(verts)[:, 1].max() <= 24
+
+    # Nothing changed: the second run skips everything and keeps the first run in its log
+    run(tmp_path, api(atlas), "--lod-sizes", "50", *options)
+    assert all(row["status"] == "skipped" for row in read_report(output_root).values())
+    records = list(read_log(os.path.join(output_root, "export_log.jsonl")))
+    assert len(records) == 12
+
+def test_cache_serves_offline_runs(atlas, tmp_path):
+    with pytest.raises(IOError):
+        run(tmp_path, api(atlas), "--offline", "--workers", "1")
+    run(tmp_path, api(atlas), "--workers", "1", "--ids", "1000")
+    # The graph and the annotation are cached: the offline run needs no API
+    output_root = run(tmp_path, LocalAllenApi({}, {}), "--offline", "--workers", "1", "--hemisphere", "right",
+                      "--ids", "1002")
+    assert read_report(output_root)[1002]["status"] == "exported"
+
+def test_source_resolution(atlas, tmp_path):
+    fine = np.repeat(np.repeat(np.repeat(atlas[0], 2, axis=0), 2, axis=1), 2, axis=2)
+    output_root = run(tmp_path, api((fine, atlas[1]), resolution=10), "--source-resolution", "10",
+                      "--workers", "1", "--ids", "1001")
+    assert read_report(output_root)[1001]["status"] == "exported"
+    cached = np.load(str(tmp_path / "cache" / "annotation_ccf_2017" / "annotation_25_from_10.npy"))
+    assert np.array_equal(cached, resample_annotation(fine, [10] * 3, [25] * 3))
@@ -0,0 +1,75 @@
+#    Tests of resample: the blockwise resampling is the mode of the fine voxels of every coarse voxel
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import os
+from collections import Counter
+import numpy as np
+import pytest
+
+from resample import coarse_indices, load_resampled, resample_annotation, resampled_shape
+
+
+def brute_force_mode(annotation, source_resolution, resolution):
+    """Most frequent label of the fine voxels of every coarse voxel, the smallest one on ties,
+    the background losing all its ties"""
+    indices = [coarse_indices(size, source, target)
+               for size, source, target in zip(annotation.shape, source_resolution, resolution)]
+    votes = {}
+    for fine, label in np.ndenumerate(annotation):
+        cell = tuple(int(index[f]) for index, f in zip(indices, fine))
+        votes.setdefault(cell, Counter())[int(label)] += 1
+    resampled = np.zeros(resampled_shape(annotation.shape, source_resolution, resolution), dtype=annotation.dtype)
+    for cell, counts in votes.items():
+        resampled[cell] = min(counts, key=lambda label: (-counts[label], label == 0, label))
+    return resampled
+
+def test_coarse_indices():
+    assert coarse_indices(4, 10, 20).tolist() == [0, 0, 1, 1]
+    # 10 um voxels centered at 5, 15, 25, 35, 45 um in 25 um voxels [0, 25), [25, 50)
+    assert coarse_indices(5, 10, 25).tolist() == [0, 0, 1, 1, 1]
+    assert resampled_shape((5, 4, 6), (10, 10, 10), (25, 20, 30)) == (2, 2, 2)
+
+@pytest.mark.parametrize("resolution", [(20, 20, 20), (25, 25, 25), (20, 25, 30)])
+def test_atlas_resampling_is_the_mode(atlas, resolution):
+    annotation = atlas[0]
+    expected = brute_force_mode(annotation, (10, 10, 10), resolution)
+    assert np.array_equal(resample_annotation(annotation, (10, 10, 10), resolution), expected)
+    # Slabs of a few planes give the same annotation
+    assert np.array_equal(resample_annotation(annotation, (10, 10, 10), resolution, slab_voxels=5000), expected)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_ties_resolve_as_the_mode(seed):
+    # Few labels in small cells: many ties, with and without the background
+    annotation = np.random.RandomState(seed).randint(0, 3, (9, 10, 11)).astype(np.uint32)
+    for resolution in ((20, 20, 20), (25, 20, 30)):
+        expected = brute_force_mode(annotation, (10, 10, 10), resolution)
+        assert np.array_equal(resample_annotation(annotation, (10, 10, 10), resolution, slab_voxels=300), expected)
+
+def test_upsampling_is_refused(atlas):
+    with pytest.raises(ValueError):
+        resample_annotation(atlas[0], (25, 25, 25), (10, 25, 25))
+
+def test_load_resampled_caches_the_annotation(atlas, tmp_path):
+    source_path = str(tmp_path / "annotation_10.nrrd")
+    open(source_path, 'w').close()
+    path = str(tmp_path / "annotation_25_from_10.npy")
+    resampled = load_resampled(atlas[0], source_path, path, (10, 10, 10), (25, 25, 25))
+    assert isinstance(resampled, np.memmap)
+    assert np.array_equal(resampled, resample_annotation(atlas[0], (10, 10, 10), (25, 25, 25)))
+    # The cache is used while it is newer than the source, whatever the source holds
+    assert np.array_equal(load_resampled(np.zeros_like(atlas[0]), source_path, path, (10, 10, 10), (25, 25, 25)),
+                          resampled)
+    os.utime(source_path, (os.path.getmtime(path) + 10,) * 2)
+    assert not load_resampled(np.zeros_like(atlas[0]), source_path, path, (10, 10, 10), (25, 25, 25)).any()
@@ -0,0 +1,65 @@
+#    Tests of sparse_mask: the run-length mask algebra against dense boolean masks
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+from sparse_mask import RunLengthMask
+
+SHAPE = (7, 9, 11)
+
+
+def random_masks(seed):
+    random = np.random.RandomState(seed)
+    return random.rand(*SHAPE) < 0.4, random.rand(*SHAPE) < 0.6
+
+@pytest.mark.parametrize("seed", range(3))
+def test_algebra_matches_dense(seed):
+    a, b = random_masks(seed)
+    ra, rb = RunLengthMask.from_dense(a), RunLengthMask.from_dense(b)
+    assert np.array_equal(ra.dense(), a)
+    assert np.array_equal(ra.union(rb).dense(), a | b)
+    assert np.array_equal(ra.intersection(rb).dense(), a & b)
+    assert np.array_equal(ra.difference(rb).dense(), a & ~b)
+    assert np.array_equal(RunLengthMask.union_all(SHAPE, [ra, rb, RunLengthMask.empty(SHAPE)]).dense(), a | b)
+    assert len(ra) == a.sum()
+    assert np.array_equal(np.sort(ra.voxels()), np.flatnonzero(a))
+
+def test_runs_stay_in_their_row():
+    # A full volume is one run per row: runs never cross the end of a row
+    mask = RunLengthMask.from_dense(np.ones(SHAPE, dtype=bool))
+    assert len(mask.starts) == SHAPE[0] * SHAPE[1]
+
+def test_crops_and_planes():
+    a = random_masks(3)[0]
+    mask = RunLengthMask.from_dense(a)
+    lower, upper = (1, 2, 3), (5, 8, 9)
+    assert np.array_equal(mask.cropped(lower, upper), a[1:5, 2:8, 3:9])
+    clipped = np.zeros(SHAPE, dtype=bool)
+    clipped[1:5, 2:8, 3:9] = a[1:5, 2:8, 3:9]
+    assert np.array_equal(mask.clipped(lower, upper).dense(), clipped)
+    for i in range(SHAPE[0]):
+        plane = np.zeros(SHAPE, dtype=bool)
+        plane[i] = a[i]
+        assert np.array_equal(mask.plane(i).dense(), plane)
+
+def test_box_and_centroid():
+    a = np.zeros(SHAPE, dtype=bool)
+    a[2:4, 3:8, 1:10] = True
+    mask = RunLengthMask.from_dense(a)
+    lower, upper = mask.bounding_box()
+    assert lower.tolist() == [2, 3, 1] and upper.tolist() == [4, 8, 10]
+    assert np.allclose(mask.centroid(), np.argwhere(a).mean(axis=0))
+    assert RunLengthMask.empty(SHAPE).bounding_box() is None
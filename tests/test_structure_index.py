@@ -0,0 +1,44 @@
+#    Tests of structure_index: names, parents and directories of the exported structures
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import json
+import os
+
+from structure_index import build_structure_index, structure_directory, write_structure_index
+
+
+def test_entries(atlas):
+    index = build_structure_index(atlas[1])
+    assert list(index) == [997, 8, 567, 1000, 1001, 1002]
+    assert index[997] == {"acronym": "root", "name": "root (root)", "parent_id": None, "directory": []}
+    assert index[1000] == {"acronym": "A", "name": "Alpha (A)", "parent_id": 567,
+                           "directory": ["root", "grey", "CH"]}
+    # A "/" would make a sub folder
+    assert index[1001]["acronym"] == "B-C" and index[1001]["name"] == "Beta (B-C)"
+    assert index[1002]["parent_id"] == 8 and index[1002]["directory"] == ["root", "grey"]
+
+def test_directories(atlas, tmp_path):
+    index = build_structure_index(atlas[1])
+    root = str(tmp_path)
+    assert structure_directory(index, 997, root) == root + os.sep
+    assert structure_directory(index, 1001, root) == os.path.join(root, "root", "grey", "CH") + os.sep
+
+def test_written_index(atlas, tmp_path):
+    index = build_structure_index(atlas[1])
+    path = str(tmp_path / "structures.json")
+    write_structure_index(index, path)
+    with open(path) as file:
+        stored = json.load(file)
+    assert stored == {str(structure_id): entry for structure_id, entry in index.items()}
@@ -0,0 +1,49 @@
+#    Tests of the structure selection of the command line driver
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import pytest
+
+from brain_structures_export import parse_arguments, select_structures
+
+
+def selected(atlas, **filters):
+    return [struct["id"] for struct in select_structures(atlas[1], **filters)]
+
+def test_everything_by_default(atlas):
+    assert selected(atlas) == [997, 8, 567, 1000, 1001, 1002]
+    assert selected(atlas, max_depth=1) == [997, 8]
+
+def test_ids_and_acronyms(atlas):
+    # In the graph order, whatever the order asked
+    assert selected(atlas, ids=[1002], acronyms=["B/C", "A"]) == [1000, 1001, 1002]
+    assert selected(atlas, acronyms=["1000"]) == [1000]
+    with pytest.raises(ValueError):
+        selected(atlas, acronyms=["XYZ"])
+
+def test_subtrees(atlas):
+    assert selected(atlas, subtrees=["CH"]) == [567, 1000, 1001]
+    assert selected(atlas, subtrees=["567"]) == [567, 1000, 1001]
+    assert selected(atlas, subtrees=["grey"], max_depth=1) == [8, 567, 1002]
+    # The structures picked by id or acronym are kept whatever the depth
+    assert selected(atlas, ids=[1001], subtrees=["grey"], max_depth=0) == [8, 1001]
+
+def test_command_line(tmp_path):
+    args = parse_arguments([str(tmp_path), "--cache-dir", str(tmp_path), "--subtrees", "CH", "1002",
+                            "--max-depth", "1", "--acronyms", "A", "--ids", "8"])
+    assert args.subtrees == ["CH", "1002"] and args.max_depth == 1
+    assert args.acronyms == ["A"] and args.ids == [8]
+    assert args.resolution == 10 and args.hemisphere == "left"
+    with pytest.raises(SystemExit):
+        parse_arguments([str(tmp_path), "--cache-dir", str(tmp_path), "--resolution", "20"])
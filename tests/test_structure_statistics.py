@@ -0,0 +1,78 @@
+#    Tests of structure_statistics: the statistics gathered while exporting and their .npz table
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+import numpy as np
+import pytest
+
+import brain_structures_export
+from binary_mesh import read_mesh
+from structure_statistics import surface_area, write_statistics
+
+VOXEL_MM3 = 0.025 ** 3
+
+
+def export_statistics(structure_id, path, **options):
+    statistics = {}
+    files = brain_structures_export.export_obj(structure_id, str(structure_id), path, binary=True,
+                                               statistics=statistics, **options)
+    return statistics, files
+
+@pytest.mark.parametrize("brick_size", [None, 8])
+def test_export_statistics(label_index, tmp_path, brick_size):
+    path = str(tmp_path) + "/"
+    voxels = np.argwhere(label_index.structure_mask(8).dense())
+    left = voxels[voxels[:, 1] < 24]
+    statistics, files = export_statistics(8, path, brick_size=brick_size)
+    assert statistics["voxel_count"] == len(left)
+    assert statistics["volume_mm3"] == pytest.approx(len(left) * VOXEL_MM3)
+    assert np.allclose(statistics["centroid"], left.mean(axis=0))
+    assert statistics["bbox_lower"] == left.min(axis=0).tolist()
+    assert statistics["bbox_upper"] == (left.max(axis=0) + 1).tolist()
+    verts, faces = read_mesh(next(file for file in files if file.endswith(".bbm")))
+    assert (statistics["vertex_count"], statistics["face_count"]) == (len(verts), len(faces))
+    assert statistics["surface_area_mm2"] == pytest.approx(surface_area(verts, faces, (25, 25, 25)), rel=1e-5)
+    # Mirrored, of the whole structure
+    assert export_statistics(8, path, hemisphere="mirrored")[0]["voxel_count"] == len(voxels)
+
+def test_surface_area():
+    # A unit cube of two triangles per side, at 25 um
+    verts = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=float)
+    faces = np.array([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+                      [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    assert surface_area(verts, faces, (25, 25, 25)) == pytest.approx(6 * 0.025 ** 2)
+
+def test_table(label_index, tmp_path):
+    path = str(tmp_path) + "/"
+    report = []
+    for structure_id in (1000, 1002, 567):
+        # D only lies in the right hemisphere: counted, with no voxel and no mesh
+        statistics = export_statistics(structure_id, path)[0]
+        report.append({"id": structure_id, "name": str(structure_id), "statistics": statistics})
+    # A failed structure has no statistics and no row
+    report.append({"id": 1001, "name": "1001", "statistics": {}})
+    write_statistics(report, str(tmp_path / "statistics.npz"))
+    table = np.load(str(tmp_path / "statistics.npz"))
+    assert table["id"].tolist() == [1000, 1002, 567]
+    assert table["name"].tolist() == ["1000", "1002", "567"]
+    for column in ("voxel_count", "vertex_count", "face_count"):
+        assert table[column].dtype == np.int64
+        assert table[column].tolist() == [report[0]["statistics"][column], 0, report[2]["statistics"][column]]
+    assert table["volume_mm3"].tolist() == [report[0]["statistics"]["volume_mm3"], 0.0,
+                                            report[2]["statistics"]["volume_mm3"]]
+    assert np.isnan(table["surface_area_mm2"][1]) and table["surface_area_mm2"][2] > 0
+    for column in ("centroid", "bbox_lower", "bbox_upper"):
+        assert table[column].shape == (3, 3)
+        assert np.isnan(table[column][1]).all()
+        assert table[column][0].tolist() == report[0]["statistics"][column]
@@ -0,0 +1,74 @@
+#    Tests of surface_nets: closed, outward meshes whose shared interfaces are the same triangles
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see http://www.gnu.org/licenses/
+
+from collections import Counter
+import numpy as np
+import pytest
+
+from surface_nets import SurfaceNet
+from conftest import signed_volume, synthetic_atlas, triangles
+
+LABELS = {"brain": [8, 567, 1000, 1001, 1002], "CH": [567, 1000, 1001], "A": [1000], "B/C": [1001], "D": [1002]}
+
+
+def directed_edges(faces):
+    return Counter(map(tuple, np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]).tolist()))
+
+def triangle_set(mesh):
+    return set(map(tuple, triangles(*mesh).tolist()))
+
+def reversed_set(mesh):
+    verts, faces = mesh
+    return triangle_set((verts, faces[:, ::-1]))
+
+@pytest.fixture(scope="module")
+def surface_net():
+    return SurfaceNet(synthetic_atlas()[0])
+
+@pytest.mark.parametrize("name", sorted(LABELS))
+def test_meshes_are_closed_and_outward(atlas, surface_net, name):
+    verts, faces = surface_net.structure_mesh(LABELS[name])
+    edges = directed_edges(faces)
+    # Every edge is crossed once in each direction
+    assert all(edges[(b, a)] == count for (a, b), count in edges.items())
+    # The vertices are inside the voxels of the surface, so the volume is a bit smaller than the voxels'
+    voxels = np.isin(atlas[0], LABELS[name]).sum()
+    assert 0.7 * voxels < signed_volume(verts, faces) <= voxels
+
+def test_shared_interfaces_are_the_same_triangles(surface_net):
+    alpha = surface_net.structure_mesh(LABELS["A"])
+    beta = surface_net.structure_mesh(LABELS["B/C"])
+    both = surface_net.structure_mesh(LABELS["A"] + LABELS["B/C"])
+    alpha_side = triangle_set(alpha) & reversed_set(beta)
+    beta_side = triangle_set(beta) & reversed_set(alpha)
+    assert alpha_side and len(alpha_side) == len(beta_side)
+    # The union is the two meshes without their interface, which they have wound opposite ways
+    assert triangle_set(both) == (triangle_set(alpha) - alpha_side) | (triangle_set(beta) - beta_side)
+
+def test_slab_size_changes_nothing(atlas, surface_net):
+    thin = SurfaceNet(atlas[0], slab_size=3)
+    for labels in LABELS.values():
+        assert triangle_set(thin.structure_mesh(labels)) == triangle_set(surface_net.structure_mesh(labels))
+
+def test_hemisphere_is_open_on_the_cut_plane(atlas):
+    half = SurfaceNet(atlas[0], ml_range=(24, 48))
+    assert half.cut_plane == 23.5
+    verts, faces = half.structure_mesh(LABELS["brain"])
+    edges = directed_edges(faces)
+    border = [edge for edge in edges if (edge[1], edge[0]) not in edges]
+    assert border
+    assert np.all(verts[np.array(border).ravel(), 1] == 23.5)
+    assert half.structure_mesh(LABELS["D"]) is not None
+    assert SurfaceNet(atlas[0], ml_range=(0, 24)).structure_mesh(LABELS["D"]) is None